@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+
+def canonical_link(link: str) -> str:
+    """Normalizes an article link to be used as a cache key.
+
+    Lowercases the scheme and the host, and drops the fragment, so the same
+    article requested through slightly different links shares one entry.
+
+    Args:
+        link (str): The article link.
+
+    Returns:
+        str: The canonical link.
+    """
+    parts = urlsplit(link.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path
+                       or '/', parts.query, ''))
+
+
+class ArticleCache:
+    """An on-disk cache of the content extracted from news articles.
+
+    Maps the canonical link of an article to its extracted text, keywords and
+    summary, so repeated runs skip both the download and the NLP. Entries
+    older than `ttl` seconds are treated as misses, and the least recently
+    used entries are evicted once the cache holds more than `max_entries`.
+
+    The cache is a SQLite database, so it can be shared by threads of the
+    same process and by concurrent processes.
+    """
+    def __init__(self,
+                 path: str = 'data/cache/articles.sqlite3',
+                 ttl: int = 60 * 60 * 24 * 90,
+                 max_entries: int = 200_000) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path,
+                                    timeout=30,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL;')
+        self._con.execute('CREATE TABLE IF NOT EXISTS articles ('
+                          'link TEXT PRIMARY KEY, text TEXT, keywords TEXT, '
+                          'summary TEXT, fetched_at REAL, accessed_at REAL);')
+        self._con.execute('CREATE INDEX IF NOT EXISTS articles_accessed_at '
+                          'ON articles (accessed_at);')
+
+    def get(self, link: str) -> Optional[dict]:
+        """Looks up the extracted content of an article.
+
+        Args:
+            link (str): The article link.
+
+        Returns:
+            Optional[dict]: A dictionary with the `text`, `keywords` and
+              `summary` of the article, or None on a miss.
+        """
+        key = canonical_link(link)
+        now = time.time()
+        with self._lock:
+            row = self._con.execute(
+                'SELECT text, keywords, summary, fetched_at FROM articles '
+                'WHERE link = ?;', (key, )).fetchone()
+            if row is None or now - row[3] > self.ttl:
+                self.misses += 1
+                return
+            self._con.execute(
+                'UPDATE articles SET accessed_at = ? WHERE link = ?;',
+                (now, key))
+            self.hits += 1
+        return {
+            'text': row[0],
+            'keywords': json.loads(row[1]),
+            'summary': row[2]
+        }
+
+    def put(self, link: str, text: str, keywords: list, summary: str) -> None:
+        """Stores the extracted content of an article.
+
+        Args:
+            link (str): The article link.
+            text (str): The article text.
+            keywords (list): The keywords extracted from the article.
+            summary (str): The summary of the article.
+        """
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                'INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?);',
+                (canonical_link(link), text, json.dumps(keywords), summary,
+                 now, now))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._con.execute('DELETE FROM articles WHERE fetched_at < ?;',
+                          (time.time() - self.ttl, ))
+        self._con.execute(
+            'DELETE FROM articles WHERE link IN (SELECT link FROM articles '
+            'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?);',
+            (self.max_entries, ))
+
+    def evict(self) -> None:
+        """Removes the expired entries and trims the cache to its size."""
+        with self._lock:
+            self._evict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._con.execute(
+                'SELECT count(*) FROM articles;').fetchone()[0]
+
+    @property
+    def stats(self) -> dict:
+        """Returns the hit/miss counters of this cache instance."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
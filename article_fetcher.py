@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Iterator, Optional
+
+import aiohttp
+
+import metrics
+
+USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class _Retry(Exception):
+    pass
+
+
+class AsyncFetcher:
+    """Downloads the HTML of many articles concurrently with asyncio.
+
+    All the requests of a batch share one pooled `aiohttp` session, with at
+    most `concurrency` open connections in total and `per_host` connections
+    to the same host, so a slow site cannot hold up the others. Failed
+    requests (connection errors, timeouts and 429/5xx responses) are retried
+    with exponential backoff.
+
+    Args:
+        concurrency (int): The maximum number of open connections.
+        per_host (int): The maximum number of open connections per host.
+        timeout (float): The connect and read timeouts of a request, in
+          seconds.
+        retries (int): The number of retries of a failed request.
+        backoff (float): The delay before the first retry, in seconds. It
+          doubles on every retry.
+    """
+    def __init__(self,
+                 concurrency: int = 64,
+                 per_host: int = 4,
+                 timeout: float = 20,
+                 retries: int = 2,
+                 backoff: float = 0.5) -> None:
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _get(self, session: aiohttp.ClientSession,
+                   url: str) -> Optional[str]:
+        start = time.perf_counter()
+        html = await self._get_with_retries(session, url)
+        metrics.inc('article_downloads_total')
+        if html is None:
+            metrics.inc('article_download_failures_total')
+        metrics.observe('article_download_seconds',
+                        time.perf_counter() - start)
+        return html
+
+    async def _get_with_retries(self, session: aiohttp.ClientSession,
+                                url: str) -> Optional[str]:
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url) as response:
+                    if response.status in RETRY_STATUS:
+                        raise _Retry
+                    if response.status >= 400:
+                        return
+                    return await response.text(errors='replace')
+            except (_Retry, aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    return
+                metrics.inc('article_download_retries_total')
+            except Exception:  # noqa
+                return
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def _run(self, urls: list, out: queue.Queue) -> None:
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         limit_per_host=self.per_host,
+                                         ttl_dns_cache=300)
+        # Time spent waiting for a free connection does not count
+        timeout = aiohttp.ClientTimeout(total=None,
+                                        sock_connect=self.timeout,
+                                        sock_read=self.timeout)
+        try:
+            async with aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=timeout,
+                    headers={'User-Agent': USER_AGENT}) as session:
+
+                async def get(url):
+                    return url, await self._get(session, url)
+
+                for task in asyncio.as_completed([get(url) for url in urls]):
+                    out.put(await task)
+        finally:
+            out.put(None)
+
+    def fetch(self, urls: list) -> Iterator[tuple]:
+        """Downloads a list of pages.
+
+        The event loop runs in a background thread, so the caller can
+        process each page while the others are still being downloaded.
+
+        Args:
+            urls (list): The links of the pages.
+
+        Yields:
+            tuple: (url, html) pairs in completion order. `html` is None if
+              the page could not be downloaded.
+        """
+        if not urls:
+            return
+        out = queue.Queue()
+        thread = threading.Thread(target=asyncio.run,
+                                  args=(self._run(list(urls), out), ),
+                                  daemon=True)
+        thread.start()
+        for item in iter(out.get, None):
+            yield item
+        thread.join()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Optional
+
+import newspaper
+import nltk
+from newspaper.article import ArticleDownloadState
+
+import near_duplicates
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def init_worker() -> None:
+    """Loads the punkt tokenizer once, when a worker process starts."""
+    try:
+        nltk.data.load('tokenizers/punkt/english.pickle')
+    except LookupError:
+        pass
+
+
+def ping() -> int:
+    """A no-op task, used to start the workers of a pool."""
+    return os.getpid()
+
+
+def get_pool(workers: Optional[int] = None) -> concurrent.futures.Executor:
+    """Returns the process pool shared by every search of this process.
+
+    The pool is created (and its workers are started) on the first call, so
+    the following searches reuse warm workers with the tokenizer already
+    loaded. A pool that broke, because one of its workers died (e.g. killed
+    for running out of memory on a large page), fails every task submitted
+    to it, so it is replaced by a new one.
+
+    Args:
+        workers (Optional[int]): The number of worker processes. Defaults to
+          the number of CPUs.
+
+    Returns:
+        concurrent.futures.Executor: The process pool.
+    """
+    workers = workers or os.cpu_count()
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is not None and getattr(pool, '_broken', False):
+            pool.shutdown(wait=False)
+            pool = None
+        if pool is None:
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker)
+            # Start the workers now, before the caller spawns any thread
+            pool.submit(ping).result()
+            _pools[workers] = pool
+        return pool
+
+
+def parse_article(link: str,
+                  html: Optional[str],
+                  language: str,
+                  timings: Optional[dict] = None) -> Optional[dict]:
+    """Extracts the text, keywords and summary of a downloaded article.
+
+    Args:
+        link (str): The article link.
+        html (Optional[str]): The HTML of the article page.
+        language (str): The two-letter code of the article language.
+        timings (Optional[dict]): If set, the seconds spent in the `parse`
+          and `nlp` stages are added to it.
+
+    Returns:
+        Optional[dict]: A dictionary with the `text`, `keywords` and
+          `summary` of the article, or None if it could not be parsed.
+    """
+    if html is None:
+        return
+    article_obj = newspaper.Article(link, language=language)
+    start = time.perf_counter()
+    try:
+        article_obj.download(input_html=html)
+        article_obj.parse()
+        parsed = time.perf_counter()
+        article_obj.nlp()
+    except newspaper.article.ArticleException:
+        return
+    if timings is not None:
+        timings['parse'] = parsed - start
+        timings['nlp'] = time.perf_counter() - parsed
+    return {
+        'text': article_obj.text,
+        'keywords': article_obj.keywords,
+        'summary': article_obj.summary
+    }
+
+
+def parse_batch(batch: list, language: str) -> list:
+    """Runs `parse_article` on a list of (link, html) pairs.
+
+    Returns:
+        list: (link, result, timings) tuples, where result is the output of
+          `parse_article`, and timings maps its stages to their duration in
+          seconds (see `metrics`).
+    """
+    results = []
+    for link, html in batch:
+        timings = {}
+        results.append((link, parse_article(link, html, language,
+                                            timings), timings))
+    return results
+
+
+def extract_article(link: str,
+                    html: Optional[str],
+                    language: str,
+                    timings: Optional[dict] = None) -> Optional[dict]:
+    """Extracts the title and text of a downloaded article, without NLP.
+
+    The first stage of `parse_article`, when the near-duplicates are
+    detected before summarizing (see `near_duplicates`).
+
+    Returns:
+        Optional[dict]: A dictionary with the `title`, `text` and MinHash
+          `signature` (of the title and text) of the article, or None if it
+          could not be parsed.
+    """
+    if html is None:
+        return
+    article_obj = newspaper.Article(link, language=language)
+    start = time.perf_counter()
+    try:
+        article_obj.download(input_html=html)
+        article_obj.parse()
+    except newspaper.article.ArticleException:
+        return
+    parsed = time.perf_counter()
+    signature = near_duplicates.minhash(
+        f'{article_obj.title} {article_obj.text}')
+    if timings is not None:
+        timings['parse'] = parsed - start
+        timings['minhash'] = time.perf_counter() - parsed
+    return {
+        'title': article_obj.title,
+        'text': article_obj.text,
+        'signature': signature
+    }
+
+
+def summarize_article(link: str,
+                      title: str,
+                      text: str,
+                      language: str,
+                      timings: Optional[dict] = None) -> Optional[dict]:
+    """Extracts the keywords and summary of an article from its text.
+
+    The second stage of `parse_article`.
+
+    Returns:
+        Optional[dict]: The same dictionary as `parse_article`, or None.
+    """
+    article_obj = newspaper.Article(link, language=language)
+    article_obj.set_title(title)
+    article_obj.set_text(text)
+    article_obj.download_state = ArticleDownloadState.SUCCESS
+    article_obj.is_parsed = True
+    start = time.perf_counter()
+    try:
+        article_obj.nlp()
+    except newspaper.article.ArticleException:
+        return
+    if timings is not None:
+        timings['nlp'] = time.perf_counter() - start
+    return {
+        'text': text,
+        'keywords': article_obj.keywords,
+        'summary': article_obj.summary
+    }
+
+
+def extract_batch(batch: list, language: str) -> list:
+    """Runs `extract_article` on a list of (link, html) pairs.
+
+    Returns:
+        list: (link, result, timings) tuples, as `parse_batch`.
+    """
+    results = []
+    for link, html in batch:
+        timings = {}
+        results.append((link, extract_article(link, html, language,
+                                              timings), timings))
+    return results
+
+
+def summarize_batch(batch: list, language: str) -> list:
+    """Runs `summarize_article` on a list of (link, title, text) tuples.
+
+    Returns:
+        list: (link, result, timings) tuples, as `parse_batch`.
+    """
+    results = []
+    for link, title, text in batch:
+        timings = {}
+        results.append((link, summarize_article(link, title, text, language,
+                                                timings), timings))
+    return results
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Import time (cold start) benchmark.
+
+Imports the modules of each entry point in fresh interpreters, and reports
+the median import time and the heavy dependencies that were loaded. The
+heavy dependencies are only needed by the stages that use them, so
+importing any of these entry points must not load them.
+
+Exits with status 1 if an entry point cannot be imported, loads a heavy
+dependency, or takes longer than `--max-seconds` to import, so it can guard
+against regressions.
+
+Usage:
+    python benchmarks/bench_import.py --repeat 5 --max-seconds 0.5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Entry point -> the modules it imports before handling any request
+TARGETS = {
+    'google_news_api': ['google_news_api'],
+    # heroku.py starts the server when imported, so import its dependencies
+    'web': [
+        'bottle', 'metrics', 'article_cache', 'google_news_api',
+        'html_export', 'jobs', 'result_cache'
+    ],
+    'cli': ['run']
+}
+HEAVY = [
+    'pandas', 'numpy', 'nltk', 'newspaper', 'pygooglenews', 'dateparser',
+    'aiohttp', 'dill', 'rich', 'pyarrow'
+]
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': seconds,
+    'heavy': [x for x in {heavy!r} if x in sys.modules]
+}}))
+'''
+
+
+def probe(modules: list) -> dict:
+    """Imports modules in a new interpreter."""
+    proc = subprocess.run(
+        [sys.executable, '-c',
+         PROBE.format(modules=modules, heavy=HEAVY)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True)
+    if proc.returncode:
+        return {'error': proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout)
+
+
+def bench(name: str, repeat: int) -> dict:
+    runs = [probe(TARGETS[name]) for _ in range(repeat)]
+    if 'error' in runs[0]:
+        return {'target': name, 'error': runs[0]['error']}
+    return {
+        'target': name,
+        'median_seconds': round(statistics.median(x['seconds'] for x in runs),
+                                4),
+        'min_seconds': round(min(x['seconds'] for x in runs), 4),
+        'heavy_modules': runs[0]['heavy']
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target',
+                        nargs='+',
+                        default=list(TARGETS),
+                        choices=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds',
+                        type=float,
+                        default=None,
+                        help='Fail if a median import time is above it')
+    parser.add_argument('--output', help='Write the reports to a JSON file')
+    args = parser.parse_args()
+
+    reports = []
+    failed = False
+    for name in args.target:
+        reports.append(bench(name, args.repeat))
+        print(json.dumps(reports[-1]))
+        report = reports[-1]
+        if 'error' in report:
+            failed = True
+            continue
+        if report['heavy_modules']:
+            failed = True
+        if (args.max_seconds is not None
+                and report['median_seconds'] > args.max_seconds):
+            failed = True
+    if args.output:
+        with open(args.output, 'w') as j:
+            json.dump(reports, j, indent=4)
+    sys.exit(int(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Offline ingest benchmarks.
+
+Runs `google_news_api.Search` and the `daily` pipeline against the local
+stand-ins of `fake_news.py`, and reports the throughput, the per-article
+latency, the number of requests and the peak memory of each stage. The
+latency of the `daily` stages runs from the first request of an article
+to the write of its row.
+
+Usage:
+    python benchmarks/bench_ingest.py --scenario all --stage run improve
+    POSTGRES_CON_STRING=... python benchmarks/bench_ingest.py --stage daily
+    POSTGRES_CON_STRING=... python benchmarks/bench_ingest.py --stage profiles
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import google_news_api  # noqa: E402
+from fake_news import SCENARIOS, FakeArticleHost, FakeGoogleNews  # noqa
+
+STAGES = ['run', 'improve', 'daily', 'profiles']
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak RSS of this process and its live children, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = Path(f'/proc/{os.getpid()}/task')
+    for task in children.glob('*/children'):
+        for pid in task.read_text().split():
+            try:
+                status = Path(f'/proc/{pid}/status').read_text()
+            except OSError:
+                continue
+            for line in status.splitlines():
+                if line.startswith('VmHWM:'):
+                    peak += int(line.split()[1]) / 1024
+    return round(peak, 1)
+
+
+def make_search(feed: FakeGoogleNews, args) -> google_news_api.Search:
+    return google_news_api.Search(query='coyote intitle:coyote',
+                                  month=args.month,
+                                  year=args.year,
+                                  language='en',
+                                  country='US',
+                                  testing=False,
+                                  silent=True,
+                                  feed_url=f'{feed.url}/rss',
+                                  feed_rate=args.feed_rate,
+                                  nlp_workers=args.nlp_workers)
+
+
+def consume(search: google_news_api.Search, raw: dict,
+            host: FakeArticleHost) -> tuple:
+    """Iterates over the improved articles and times each of them."""
+    latencies = []
+    count = 0
+    for article in search.iter_articles(raw):
+        done = time.monotonic()
+        count += 1
+        started = host.first_request.get(urlsplit(article['link']).path)
+        if started is not None:
+            latencies.append(done - started)
+    return count, latencies
+
+
+class WriteTimer:
+    """Times each article from its first request to the write of its row.
+
+    Pass it as the `on_write` callback of `daily.loop_profiles`.
+    """
+    def __init__(self, host: FakeArticleHost) -> None:
+        self.host = host
+        self.latencies = []
+
+    def __call__(self, table: str, links: list) -> None:
+        done = time.monotonic()
+        for link in links:
+            started = self.host.first_request.get(urlsplit(link).path)
+            if started is not None:
+                self.latencies.append(done - started)
+
+
+def report(stage: str, scenario: str, elapsed: float, articles: int,
+           latencies: list, feed: FakeGoogleNews,
+           host: FakeArticleHost) -> dict:
+    """Summarizes a stage; the latencies are left out if there are none."""
+    result = {
+        'stage': stage,
+        'scenario': scenario,
+        'articles': articles,
+        'seconds': round(elapsed, 3),
+        'articles_per_second': round(articles / elapsed, 2) if elapsed else 0
+    }
+    if latencies:
+        result['latency_p50_ms'] = round(percentile(latencies, 0.5) * 1000, 1)
+        result['latency_p99_ms'] = round(
+            percentile(latencies, 0.99) * 1000, 1)
+    return {
+        **result, 'feed_requests': feed.total_requests,
+        'article_requests': host.total_requests,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def bench_run(name: str, args) -> dict:
+    """`Search.request` followed by `Search.iter_articles`."""
+    scenario = SCENARIOS[name]
+    with FakeArticleHost(scenario) as host, \
+            FakeGoogleNews(scenario, host.url) as feed:
+        search = make_search(feed, args)
+        start = time.monotonic()
+        raw = search.request()
+        count, latencies = consume(search, raw, host)
+        elapsed = time.monotonic() - start
+        return report('run', name, elapsed, count, latencies, feed, host)
+
+
+def bench_improve(name: str, args) -> dict:
+    """`Search.iter_articles` alone, on a feed that is already fetched."""
+    scenario = SCENARIOS[name]
+    with FakeArticleHost(scenario) as host, \
+            FakeGoogleNews(scenario, host.url) as feed:
+        search = make_search(feed, args)
+        raw = search.request()
+        feed.requests.clear()
+        start = time.monotonic()
+        count, latencies = consume(search, raw, host)
+        elapsed = time.monotonic() - start
+        return report('improve', name, elapsed, count, latencies, feed, host)
+
+
+@contextmanager
+def scratch_state(tables: list, profiles: list):
+    """Isolates a `daily` benchmark from the production state.
+
+    Creates empty benchmark tables, and yields a fresh article cache and
+    near-duplicates index in a temporary directory, so repeated runs start
+    cold. On exit, the benchmark tables are dropped, and their daily counts
+    and the watermarks of the profiles are deleted.
+
+    Yields:
+        dict: The `cache` and `duplicates` keyword arguments of
+          `daily.loop_profiles`.
+    """
+    import sqlalchemy
+
+    import daily
+
+    db = daily.DB(os.environ['POSTGRES_CON_STRING']).select(
+        'postgres').connect()
+
+    def drop() -> None:
+        inspector = sqlalchemy.inspect(db)
+        for table in tables:
+            db.execute(f'DROP TABLE IF EXISTS {table};')
+            if inspector.has_table('article_daily_counts'):
+                db.execute(
+                    'DELETE FROM article_daily_counts '
+                    'WHERE table_name = %s;', (table, ))
+        if inspector.has_table('ingest_watermarks'):
+            for profile in profiles:
+                db.execute(
+                    'DELETE FROM ingest_watermarks '
+                    'WHERE language = %s AND query = %s;',
+                    (profile['language'], profile['query']))
+
+    drop()
+    for table in tables:
+        daily.ensure_articles_table(db, table)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            yield {
+                'cache':
+                daily.ArticleCache(f'{tmp}/articles.sqlite3'),
+                'duplicates':
+                daily.NearDuplicateIndex(f'{tmp}/near_duplicates.sqlite3')
+            }
+    finally:
+        drop()
+        db.close()
+
+
+def bench_daily(name: str, args) -> dict:
+    """`daily.loop` (feed, articles, NLP and writes) into a scratch table."""
+    if not os.environ.get('POSTGRES_CON_STRING'):
+        return {
+            'stage': 'daily',
+            'scenario': name,
+            'skipped': 'POSTGRES_CON_STRING is not set'
+        }
+    import daily
+
+    scenario = SCENARIOS[name]
+    vals = {
+        'table': 'bench_articles',
+        'language': 'en',
+        'country': 'US',
+        'query': f'bench {name}'
+    }
+    with FakeArticleHost(scenario) as host, \
+            FakeGoogleNews(scenario, host.url) as feed, \
+            scratch_state([vals['table']], [vals]) as state:
+        os.environ['GOOGLE_NEWS_RSS_URL'] = f'{feed.url}/rss'
+        timer = WriteTimer(host)
+        start = time.monotonic()
+        inserted, _, rows_per_second = daily.loop(vals,
+                                                  args.year,
+                                                  args.month,
+                                                  on_write=timer,
+                                                  **state)
+        elapsed = time.monotonic() - start
+        return {
+            **report('daily', name, elapsed, inserted, timer.latencies,
+                     feed, host),
+            'write_rows_per_second': rows_per_second
+        }
+
+
+def bench_profiles(name: str, args) -> dict:
+    """`daily.loop_profiles` with two queries that find the same articles.
+
+    Each article should be requested once, whatever the number of profiles.
+    """
+    if not os.environ.get('POSTGRES_CON_STRING'):
+        return {
+            'stage': 'profiles',
+            'scenario': name,
+            'skipped': 'POSTGRES_CON_STRING is not set'
+        }
+    import daily
+
+    scenario = SCENARIOS[name]
+    tables = ['bench_articles', 'bench_articles_b']
+    profiles = [{
+        'table': table,
+        'language': 'en',
+        'country': 'US',
+        'query': f'bench {name} {table}'
+    } for table in tables]
+    with FakeArticleHost(scenario) as host, \
+            FakeGoogleNews(scenario, host.url) as feed, \
+            scratch_state(tables, profiles) as state:
+        os.environ['GOOGLE_NEWS_RSS_URL'] = f'{feed.url}/rss'
+        timer = WriteTimer(host)
+        start = time.monotonic()
+        result = daily.loop_profiles(profiles,
+                                     args.year,
+                                     args.month,
+                                     on_write=timer,
+                                     **state)
+        elapsed = time.monotonic() - start
+        return {
+            **report('profiles', name, elapsed, result['links'],
+                     timer.latencies, feed, host),
+            'profiles': len(profiles),
+            'shared': result['shared'],
+            'inserted': {x: y[0]
+                         for x, y in result['tables'].items()},
+            'write_rows_per_second': result['rows_per_second']
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario',
+                        nargs='+',
+                        default=['all'],
+                        choices=['all', *SCENARIOS])
+    parser.add_argument('--stage',
+                        nargs='+',
+                        default=['run', 'improve'],
+                        choices=STAGES)
+    parser.add_argument('--month', type=int, default=1)
+    parser.add_argument('--year', type=int, default=2020)
+    parser.add_argument('--feed-rate', type=float, default=1000.)
+    parser.add_argument('--nlp-workers', type=int, default=None)
+    parser.add_argument('--output', help='Write the reports to a JSON file')
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS) if 'all' in args.scenario else args.scenario
+    benches = {'run': bench_run, 'improve': bench_improve,
+               'daily': bench_daily, 'profiles': bench_profiles}
+    reports = []
+    for name in scenarios:
+        for stage in args.stage:
+            reports.append(benches[stage](name, args))
+            print(json.dumps(reports[-1]))
+    if args.output:
+        with open(args.output, 'w') as j:
+            json.dump(reports, j, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Database load benchmark.
+
+Loads synthetic articles, in the layout of `daily.to_frame`, into a
+scratch table with `DataFrame.to_sql`, with a single `database.copy_merge`
+and the way `daily.loop_profiles` writes them (a pooled connection, a frame
+conversion and a merge per `daily.WRITE_BATCH` rows), and reports the rows
+per second of each. The frame is then loaded again, to time the merge when
+every row already exists.
+
+Usage:
+    POSTGRES_CON_STRING=... python benchmarks/bench_load.py --rows 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import daily  # noqa: E402
+from bench_transforms import synthetic_articles  # noqa: E402
+from database import DB, copy_merge, ensure_articles_table  # noqa: E402
+
+TABLE = 'bench_load'
+
+
+def articles_records(rows: int) -> list:
+    df = synthetic_articles(rows).rename(columns=str.capitalize)
+    df['Id'] = df.Link
+    df['Title'] = df.Title + ' ' + df.index.astype(str)
+    return df.to_dict('records')
+
+
+def timed(name: str, rows: int, fn) -> dict:
+    start = time.monotonic()
+    inserted = fn()
+    seconds = time.monotonic() - start
+    return {
+        'loader': name,
+        'rows': rows,
+        'inserted': inserted,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    if not os.environ.get('POSTGRES_CON_STRING'):
+        sys.exit('POSTGRES_CON_STRING is not set')
+
+    records = articles_records(args.rows)
+    df = daily.to_frame(records)
+    engine = DB(os.environ['POSTGRES_CON_STRING']).select('postgres')
+    db = engine.connect()
+
+    def reset() -> None:
+        db.execute(f'DROP TABLE IF EXISTS {TABLE};')
+        ensure_articles_table(db, TABLE)
+
+    def to_sql() -> int:
+        df.to_sql(TABLE, db, if_exists='append', index=True)
+        return len(df)
+
+    def flushes() -> int:
+        inserted = 0
+        for i in range(0, len(records), daily.WRITE_BATCH):
+            batch = daily.to_frame(records[i:i + daily.WRITE_BATCH])
+            with engine.connect() as con:
+                inserted += daily.insert_new(con, TABLE, batch)[0]
+        return inserted
+
+    reset()
+    reports = [timed('to_sql', len(df), to_sql)]
+    reset()
+    reports.append(
+        timed('copy_merge', len(df), lambda: copy_merge(db, TABLE, df)[0]))
+    reports.append(
+        timed('copy_merge (existing rows)', len(df),
+              lambda: copy_merge(db, TABLE, df)[0]))
+    reset()
+    reports.append(
+        timed(f'daily flushes of {daily.WRITE_BATCH}', len(df), flushes))
+    db.execute(f'DROP TABLE IF EXISTS {TABLE};')
+    db.execute('DELETE FROM article_daily_counts WHERE table_name = %s;',
+               (TABLE, ))
+    db.close()
+    for report in reports:
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Cleaning and formatting microbenchmark.
+
+Compares the per-row `Series.apply` path of `daily.to_frame` and
+`ExportData.to_markdown` with the vectorized `transforms` on a synthetic
+frame of improved articles, and checks that both give the same output.
+
+Usage:
+    python benchmarks/bench_transforms.py --articles 100000
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import transforms  # noqa: E402
+from google_news_api import ExportData  # noqa: E402
+from fake_news import WORDS  # noqa: E402
+
+
+def synthetic_articles(n: int, seed: int = 0) -> pd.DataFrame:
+    """Returns `n` improved articles, as `ExportData._to_pandas` gets them."""
+    rnd = random.Random(seed)
+
+    def text(words: int) -> str:
+        return ' '.join(
+            rnd.choice(WORDS + ['|', '\n', '\\n', '(x)'])
+            for _ in range(words))
+
+    return pd.DataFrame({
+        'title': [text(10) for _ in range(n)],
+        'link': [f'https://example.com/{i}.html' for i in range(n)],
+        'published': [f'2020-{rnd.randint(1, 12):02d}-01' for _ in range(n)],
+        'source': [{
+            'href': 'https://example.com',
+            'title': text(2)
+        } for _ in range(n)],
+        'keywords': [rnd.sample(WORDS, rnd.randint(0, 8)) for _ in range(n)],
+        'summary': [text(60) for _ in range(n)]
+    })
+
+
+def per_row(df: pd.DataFrame) -> pd.DataFrame:
+    """The per-row path, as it was before `transforms`."""
+    df = df.replace(r'\\n', ' ', regex=True)
+    df['summary'] = df.summary.apply(ExportData.remove_bad_chars)
+    df['title'] = df.title.apply(ExportData.remove_bad_chars)
+    df['link'] = df.link.apply(ExportData.md_link)
+    df['source'] = df.source.apply(ExportData.source)
+    df['keywords'] = df.keywords.apply(ExportData.style_keywords)
+    df['index'] = df.title.apply(
+        lambda x: hashlib.md5(x.encode('utf-8')).hexdigest())
+    return df
+
+
+def vectorized(df: pd.DataFrame) -> pd.DataFrame:
+    df = transforms.replace_escaped_newlines(df.copy())
+    df['summary'] = transforms.clean_text(df.summary)
+    df['title'] = transforms.clean_text(df.title)
+    df['link'] = transforms.md_links(df.link)
+    df['source'] = transforms.md_sources(df.source)
+    df['keywords'] = transforms.style_keywords(df.keywords)
+    df['index'] = transforms.hash_titles(df.title)
+    return df
+
+
+def best_of(fn, df: pd.DataFrame, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_articles(args.articles)
+    row_s, expected = best_of(per_row, df, args.repeat)
+    vec_s, out = best_of(vectorized, df, args.repeat)
+    pd.testing.assert_frame_equal(out, expected)
+    print(
+        json.dumps({
+            'articles': args.articles,
+            'per_row_seconds': round(row_s, 3),
+            'vectorized_seconds': round(vec_s, 3),
+            'speedup': round(row_s / vec_s, 2)
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Local stand-ins for Google News and the article hosts.
+
+`FakeGoogleNews` serves an RSS search endpoint compatible with what
+`pygooglenews.GoogleNews.search` requests and parses (including the 100
+entries cap), and `FakeArticleHost` serves synthetic article pages with a
+configurable latency and size. Both run in background threads and count
+the requests they receive.
+"""
+
+import html
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FEED_CAP = 100
+
+WORDS = ('coyote attack bite park child dog neighborhood officials wildlife '
+         'residents trail animal police aggressive morning evening county '
+         'report injured hospital warning pets yard sighting trapped').split()
+
+
+@dataclass
+class Scenario:
+    """A repeatable benchmark scenario.
+
+    Args:
+        name (str): The name of the scenario.
+        per_day (int): The number of articles published every day.
+        busy_days (dict): Days of the month with a different number of
+          articles (day of the month -> articles).
+        latency (float): The latency of an article page, in seconds.
+        slow_share (float): The share of articles served with
+          `slow_latency` instead of `latency`.
+        slow_latency (float): The latency of the slow articles, in seconds.
+        paragraphs (int): The number of paragraphs of an article page.
+    """
+    name: str
+    per_day: int
+    busy_days: dict = None
+    latency: float = 0.02
+    slow_share: float = 0.
+    slow_latency: float = 2.
+    paragraphs: int = 12
+
+    def articles_on(self, day: date) -> int:
+        return (self.busy_days or {}).get(day.day, self.per_day)
+
+
+SCENARIOS = {
+    'sparse': Scenario('sparse', per_day=2),
+    'saturated': Scenario('saturated', per_day=12, busy_days={15: 140}),
+    'slow-hosts': Scenario('slow-hosts', per_day=6, slow_share=0.2),
+    'large-pages': Scenario('large-pages', per_day=6, paragraphs=200),
+}
+
+
+class _Server:
+    def __init__(self, handler) -> None:
+        self.requests = Counter()
+        self.first_request = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa
+                with server._lock:
+                    server.requests[self.path.split('?')[0]] += 1
+                    server.first_request.setdefault(self.path,
+                                                    time.monotonic())
+                status, ctype, body = handler(self.path)
+                body = body.encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', ctype)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+
+class FakeArticleHost(_Server):
+    """Serves synthetic article pages at /<yyyy-mm-dd>/<n>.html."""
+    def __init__(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        super().__init__(self._page)
+
+    def _page(self, path: str) -> tuple:
+        match = re.match(r'^/(\d{4}-\d{2}-\d{2})/(\d+)\.html$', path)
+        if not match:
+            return 404, 'text/plain', 'Not found'
+        rnd = random.Random(path)
+        latency = self.scenario.latency
+        if rnd.random() < self.scenario.slow_share:
+            latency = self.scenario.slow_latency
+        time.sleep(latency)
+        title = article_title(match.group(1), int(match.group(2)))
+        paragraphs = ''.join(
+            '<p>' + ' '.join(rnd.choice(WORDS).capitalize() if i == 0 else
+                             rnd.choice(WORDS) for i in range(40)) + '.</p>'
+            for _ in range(self.scenario.paragraphs))
+        return 200, 'text/html; charset=utf-8', (
+            f'<html><head><title>{title}</title></head><body><article>'
+            f'<h1>{title}</h1>{paragraphs}</article></body></html>')
+
+
+class FakeGoogleNews(_Server):
+    """Serves /rss/search with `after:`/`before:` date filtering.
+
+    Pass `url + '/rss'` as the `feed_url` of `google_news_api.Search` (or as
+    the `GOOGLE_NEWS_RSS_URL` environment variable).
+    """
+    def __init__(self, scenario: Scenario, article_url: str) -> None:
+        self.scenario = scenario
+        self.article_url = article_url
+        super().__init__(self._feed)
+
+    def _feed(self, path: str) -> tuple:
+        parts = urlsplit(path)
+        if parts.path != '/rss/search':
+            return 404, 'text/plain', 'Not found'
+        query = parse_qs(parts.query).get('q', [''])[0]
+        after = re.search(r'after:(\d{4}-\d{2}-\d{2})', query)
+        before = re.search(r'before:(\d{4}-\d{2}-\d{2})', query)
+        start = date.fromisoformat(after.group(1))
+        end = date.fromisoformat(before.group(1))
+        items = []
+        day = start
+        while day < end:
+            for n in range(self.scenario.articles_on(day)):
+                items.append(self._item(day, n))
+            day += timedelta(days=1)
+        items = items[:FEED_CAP]
+        return 200, 'application/rss+xml; charset=utf-8', (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0">'
+            '<channel><title>"coyote" - Google News</title>'
+            '<link>https://news.google.com</link>'
+            '<language>en-US</language>'
+            f'{"".join(items)}</channel></rss>')
+
+    def _item(self, day: date, n: int) -> str:
+        link = f'{self.article_url}/{day.isoformat()}/{n}.html'
+        title = article_title(day.isoformat(), n)
+        published = format_datetime(
+            datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc))
+        description = html.escape(f'<a href="{link}">{title}</a>&nbsp;&nbsp;'
+                                  '<font color="#6f6f6f">Bench Post</font>')
+        return (f'<item><title>{title} - Bench Post</title><link>{link}</link>'
+                f'<guid isPermaLink="false">{day.isoformat()}-{n}</guid>'
+                f'<pubDate>{published}</pubDate>'
+                f'<description>{description}</description>'
+                f'<source url="{self.article_url}">Bench Post</source></item>')
+
+
+def article_title(day: str, n: int) -> str:
+    return f'Coyote bites resident near park ({day} #{n})'
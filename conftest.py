@@ -0,0 +1,2 @@
+# coding: utf-8
+"""Puts the top-level modules on the path of the tests in tests/."""
@@ -3,38 +3,59 @@
 
 # NOT FOR USE IN PRODUCTION!!
 
+import argparse
 import datetime
 import hashlib
+import json
 import os
+import re
 import signal
 import sys
-from datetime import datetime
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from itertools import chain
+from typing import Callable, Optional
 
 import nltk
 import numpy as np
 import pandas as pd
-import ray
 import requests
 import sqlalchemy
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+import article_nlp
 import google_news_api
-
-
-class DB:
-
-    def __init__(self, conn_string):
-        self.conn_string = conn_string
-
-    def select(self, db_name):
-        args = {
-            'dbname': db_name,
-            # 'sslrootcert': 'certs/DigiCertGlobalRootCA.crt.pem',
-            # 'sslmode': 'verify-full'
-        }
-        db = sqlalchemy.create_engine(self.conn_string, connect_args=args)
-        return db
+import metrics
+import transforms
+from article_cache import ArticleCache, canonical_link
+from database import (DB, copy_merge, date_bounds, ensure_articles_table,
+                      rebuild_daily_counts)
+from near_duplicates import NearDuplicateIndex
+from scheduler import JobScheduler
+
+
+FIRST_DATE = date(2010, 1, 1)
+# The articles of a table are written when this many are buffered, or when
+# the oldest one has been waiting for `WRITE_SECONDS`
+WRITE_BATCH = 1000
+WRITE_SECONDS = 30.
+
+PROFILES = [{
+    'table': 'articles',
+    'language': 'en',
+    'country': 'US',
+    'query': 'coyote (bite OR attack OR kill OR chase OR aggressive OR nip) '
+    'intitle:coyote'
+}, {
+    'table': 'articles_es',
+    'language': 'es',
+    'country': 'MX',
+    'query': 'coyote (mordida OR ataque OR caza OR agresivo OR mordisco) '
+    'intitle:coyote'
+}]
+PROFILE_KEYS = ('table', 'language', 'country', 'query')
 
 
 def keyboard_interrupt_handler(sig: int, _) -> None:
@@ -47,100 +68,480 @@ def _hash(x):
     return hashlib.md5(x.encode('utf-8')).hexdigest()
 
 
-@ray.remote
-def loop(vals, year, month):
-    if month > int(datetime.now().strftime('%m')) or year > int(
-            datetime.now().strftime('%Y')):
+def existing_ids(db, table: str, ids) -> set:
+    """Looks up which article hashes are already stored in a table.
+
+    All the hashes of a batch are sent in a single round trip and matched
+    with an equality lookup on the `index` column, so the cost depends on the
+    size of the batch, not on the size of the table.
+
+    Args:
+        db: An open SQLAlchemy connection.
+        table (str): The name of the articles table.
+        ids: An iterable of md5 article hashes.
+
+    Returns:
+        set: The subset of `ids` that already exists in `table`.
+    """
+    ids = list(set(ids))
+    if not ids or not sqlalchemy.inspect(db).has_table(table):
+        return set()
+    stmt = sqlalchemy.text(
+        f'SELECT "index" FROM {table} WHERE "index" IN :ids').bindparams(
+            sqlalchemy.bindparam('ids', expanding=True))
+    return {row[0] for row in db.execute(stmt, {'ids': ids})}
+
+
+def insert_new(db, table: str, df: pd.DataFrame) -> tuple:
+    """Bulk loads the articles of a batch that are not stored yet.
+
+    The rows are loaded with `COPY` and merged with `ON CONFLICT DO NOTHING`
+    (see `database.copy_merge`), so concurrent jobs cannot insert the same
+    article twice. The daily counts summary of the table is updated in the
+    same transaction. The table must exist (see `ensure_articles_table`).
+
+    Args:
+        db: An open SQLAlchemy connection.
+        table (str): The name of the articles table.
+        df (pd.DataFrame): A batch of articles indexed by their md5 hash.
+
+    Returns:
+        tuple: The number of inserted and skipped articles, and the time the
+          load took in seconds.
+    """
+    if df.empty:
+        return 0, 0, 0.
+    inserted, seconds = copy_merge(db, table, df)
+    return inserted, len(df) - inserted, seconds
+
+
+def month_windows(start: date, end: date) -> list:
+    """Lists the (year, month) pairs between two dates, both inclusive."""
+    windows = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        windows.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return windows
+
+
+def read_watermark(db, vals: dict, shared: bool = False) -> Optional[date]:
+    """Returns the newest published date ingested for a (language, query).
+
+    The mark is read from the `ingest_watermarks` state table. If there is no
+    state yet, it falls back to the newest `published` value in the target
+    table, so existing databases switch to incremental mode without a full
+    backfill. A profile without a mark that shares its table with other
+    profiles has no fallback once the state table exists: the newest row
+    of the table may have been found by another query, so the history of
+    the new one would never be fetched.
+
+    Args:
+        db: An open SQLAlchemy connection.
+        vals (dict): The language settings (table, language, query).
+        shared (bool, optional): Whether other profiles write to the same
+          table. Defaults to False.
+
+    Returns:
+        Optional[date]: The high-water mark, or None if nothing is ingested.
+    """
+    inspector = sqlalchemy.inspect(db)
+    mark = None
+    fallback = True
+    if inspector.has_table('ingest_watermarks'):
+        mark = db.execute(
+            sqlalchemy.text('SELECT watermark FROM ingest_watermarks WHERE '
+                            'language = :language AND query = :query'),
+            {'language': vals['language'], 'query': vals['query']}).scalar()
+        fallback = not shared
+    if mark is None and fallback and inspector.has_table(vals['table']):
+        mark = db.execute(
+            f'SELECT max(published) FROM {vals["table"]};').scalar()
+    if mark is None:
         return
-
-    kwargs = {
-        'query': vals['query'],
-        'month': month,
-        'year': year,
-        'language': vals['language'],
-        'country': vals['country'],
-        'testing': False,
-        'silent': True
-    }
-
-    try:
-        search = google_news_api.Search(**kwargs)
-        results = search.run()
-        export = google_news_api.ExportData(results, **kwargs)
-        df = export._to_pandas()
+    return pd.to_datetime(mark).date()
+
+
+def write_watermark(db, vals: dict, mark: date) -> None:
+    """Moves the high-water mark of a (language, query) forward."""
+    db.execute('CREATE TABLE IF NOT EXISTS ingest_watermarks ('
+               'language text, query text, watermark date, '
+               'updated_at timestamp DEFAULT now(), '
+               'PRIMARY KEY (language, query));')
+    db.execute(
+        sqlalchemy.text(
+            'INSERT INTO ingest_watermarks (language, query, watermark) '
+            'VALUES (:language, :query, :mark) '
+            'ON CONFLICT (language, query) DO UPDATE SET '
+            'watermark = GREATEST(ingest_watermarks.watermark, '
+            'EXCLUDED.watermark), updated_at = now();'), {
+                'language': vals['language'],
+                'query': vals['query'],
+                'mark': mark
+            })
+
+
+def plan_windows(db,
+                 vals: dict,
+                 incremental: bool,
+                 lookback_days: int,
+                 shared: bool = False) -> list:
+    """Lists the (year, month) windows to fetch for a language.
+
+    In incremental mode, only the months at or after the high-water mark
+    (minus `lookback_days`, to catch late-indexed stories) are fetched.
+    Otherwise, or when there is no mark yet, the whole history is fetched.
+    `shared` is passed to `read_watermark`.
+    """
+    start = FIRST_DATE
+    if incremental:
+        mark = read_watermark(db, vals, shared)
+        if mark is not None:
+            start = max(FIRST_DATE, mark - timedelta(days=lookback_days))
+    return month_windows(start, date.today())
+
+
+def to_frame(articles: list) -> pd.DataFrame:
+    """Converts a chunk of improved articles to the articles table layout."""
+    df = google_news_api.ExportData.articles_to_pandas(articles)
+    with metrics.timer('dataframe_transform_seconds'):
         df.drop(columns=['Id', 'Source'], inplace=True)
-        df['Summary'] = df.Summary.apply(export.remove_bad_chars)
-        df['Title'] = df.Title.apply(export.remove_bad_chars)
-        df['Link'] = df.Link.apply(export.md_link)
-        df['Keywords'] = df.Keywords.apply(export.style_keywords)
-        df['Index'] = df.Title.apply(_hash)
+        df['Summary'] = transforms.clean_text(df.Summary)
+        df['Title'] = transforms.clean_text(df.Title)
+        df['Link'] = transforms.md_links(df.Link)
+        df['Keywords'] = transforms.style_keywords(df.Keywords)
+        df['Index'] = transforms.hash_titles(df.Title)
         df.rename(columns=dict([(x, x.lower()) for x in df.columns]),
                   inplace=True)
         df.set_index('index', inplace=True)
-        return df
-    except google_news_api.NoEntriesExit:
-        return
-
-
-def google_news():
-    signal.signal(signal.SIGINT, keyboard_interrupt_handler)
-
-    psql = DB(os.environ['POSTGRES_CON_STRING'])
-    db = psql.select('postgres').connect()
-
-    languages = {
-        'english': {
-            'table':
-            'articles',
-            'language':
-            'en',
-            'country':
-            'US',
-            'query':
-            'coyote (bite OR attack OR kill OR chase OR aggressive OR nip) '
-            'intitle:coyote'
-        },
-        'spanish': {
-            'table':
-            'articles_es',
-            'language':
-            'es',
-            'country':
-            'MX',
-            'query':
-            'coyote (mordida OR ataque OR caza OR agresivo OR mordisco) '
-            'intitle:coyote'
-        }
+    return df
+
+
+def merge_feeds(feeds: list) -> tuple:
+    """Dedupes the feed entries of several profiles by canonical link.
+
+    Args:
+        feeds (list): (profile, entries) pairs, with the raw feed entries
+          found for each profile.
+
+    Returns:
+        tuple: A dict mapping each language to the entries to process in
+          that language, with each link once (in the language of the first
+          profile that found it), and a dict mapping each canonical link to
+          the (profile, entry) pairs that found it.
+    """
+    found = defaultdict(list)
+    to_process = defaultdict(list)
+    for profile, entries in feeds:
+        for entry in entries:
+            key = canonical_link(entry['link'])
+            if key not in found:
+                to_process[profile['language']].append(entry)
+            found[key].append((profile, entry))
+    return dict(to_process), dict(found)
+
+
+def loop_profiles(profiles: list,
+                  year: int,
+                  month: int,
+                  cache: Optional[ArticleCache] = None,
+                  duplicates: Optional[NearDuplicateIndex] = None,
+                  on_write: Optional[Callable] = None) -> dict:
+    """Fetches one month for several profiles, sharing the article work.
+
+    The feed of each profile is requested, then the entries are deduped by
+    canonical link (see `merge_feeds`), so an article found by several
+    profiles is downloaded, parsed and summarized once. Each processed
+    article is fanned out to the tables of every profile that found it,
+    with the title and date of that profile's own feed entry.
+
+    Articles are written in chunks of `WRITE_BATCH` per table, or as soon
+    as the oldest buffered one has been waiting for `WRITE_SECONDS`. The
+    tables must exist (see `ensure_articles_table`). The high-water marks are not moved here, but by
+    the driver once the month completed (see `advance_watermarks`).
+
+    Args:
+        profiles (list): The profiles to fetch (see `load_profiles`).
+        year (int): The year of the month.
+        month (int): The month.
+        cache (Optional[ArticleCache]): The article cache. Defaults to the
+          shared one in `data/cache/`.
+        duplicates (Optional[NearDuplicateIndex]): The near-duplicates
+          index. Defaults to the shared one in `data/cache/`.
+        on_write (Optional[Callable]): Called with the table and the links
+          of the articles of each chunk, once it is written.
+
+    Returns:
+        dict: The number of unique `links` and of links found by several
+          profiles (`shared`), the number of inserted and skipped articles
+          per table (`tables`), the rows per second of the writes, from
+          the frame conversion to the commit (`rows_per_second`), and the newest published date (ISO
+          format) found for each profile (`marks`, by `watermark_key`).
+    """
+    result = {
+        'links': 0,
+        'shared': 0,
+        'tables': {profile['table']: [0, 0]
+                   for profile in profiles},
+        'rows_per_second': None,
+        'marks': {}
     }
+    now = datetime.now()
+    if (year, month) > (now.year, now.month):
+        return result
+
+    if cache is None:
+        cache = ArticleCache()
+    if duplicates is None:
+        duplicates = NearDuplicateIndex()
+
+    def search(profile: dict) -> google_news_api.Search:
+        return google_news_api.Search(query=profile['query'],
+                                      month=month,
+                                      year=year,
+                                      language=profile['language'],
+                                      country=profile['country'],
+                                      testing=False,
+                                      silent=True,
+                                      cache=cache,
+                                      duplicates=duplicates)
+
+    feeds = [(profile, search(profile).request()['entries'])
+             for profile in profiles]
+    for profile, entries in feeds:
+        mark = pd.to_datetime([x.get('published') for x in entries],
+                              errors='coerce').max()
+        if pd.notna(mark):
+            result['marks'][watermark_key(profile)] = mark.date().isoformat()
+    to_process, found = merge_feeds(feeds)
+    result['links'] = len(found)
+    result['shared'] = sum(len(x) > 1 for x in found.values())
+    if not found:
+        return result
+
+    # The first profile of each language processes the articles in it
+    searches = {}
+    for profile in profiles:
+        searches.setdefault(profile['language'], search(profile))
+
+    engine = DB(os.environ['POSTGRES_CON_STRING']).select('postgres')
+    buffers = defaultdict(list)
+    # Tables -> the time their oldest buffered article was added
+    buffered_at = {}
+    written = defaultdict(set)
+    write_seconds = 0.
+
+    def flush(table: str) -> None:
+        nonlocal write_seconds
+        rows = buffers.pop(table, [])
+        buffered_at.pop(table, None)
+        if not rows:
+            return
+        start = time.monotonic()
+        df = to_frame(rows)
+        # Only hold a pooled connection while writing
+        with engine.connect() as db:
+            n_inserted, n_skipped, _ = insert_new(db, table, df)
+        result['tables'][table][0] += n_inserted
+        result['tables'][table][1] += n_skipped
+        write_seconds += time.monotonic() - start
+        if on_write is not None:
+            on_write(table, [x['link'] for x in rows])
+
+    articles = chain.from_iterable(
+        searches[language].iter_articles({'entries': entries})
+        for language, entries in to_process.items())
+    for article in articles:
+        key = canonical_link(article['link'])
+        for profile, entry in found[key]:
+            table = profile['table']
+            if key in written[table]:
+                continue
+            written[table].add(key)
+            fanned_out = google_news_api.Search.clean_entry(entry)
+            for field in ('keywords', 'summary', 'cluster'):
+                if field in article:
+                    fanned_out[field] = article[field]
+            buffers[table].append(fanned_out)
+            buffered_at.setdefault(table, time.monotonic())
+            if (len(buffers[table]) >= WRITE_BATCH or
+                    time.monotonic() - buffered_at[table] >= WRITE_SECONDS):
+                flush(table)
+    for table in list(buffers):
+        flush(table)
+
+    if write_seconds:
+        rows = sum(sum(x) for x in result['tables'].values())
+        result['rows_per_second'] = round(rows / write_seconds, 1)
+    return result
+
+
+def loop(vals, year, month, **kwargs):
+    """Fetches one month of a single profile (see `loop_profiles`).
+
+    The high-water mark of the profile is not moved. The keyword arguments
+    are passed to `loop_profiles`.
+
+    Returns:
+        tuple: The number of inserted and skipped articles, and the rows per
+          second of the database writes.
+    """
+    result = loop_profiles([vals], year, month, **kwargs)
+    inserted, skipped = result['tables'][vals['table']]
+    return inserted, skipped, result['rows_per_second']
+
+
+def watermark_key(profile: dict) -> str:
+    """Returns the key of the high-water mark of a profile."""
+    return f'{profile["language"]}/{profile["query"]}'
+
+
+def advance_watermarks(db, profiles: list, planned: dict, done: dict,
+                       marks: dict) -> None:
+    """Moves the high-water marks forward over the completed months.
+
+    The mark of a profile only moves across the months that completed
+    without a gap since its first planned month. A failed or unfinished
+    month is therefore never skipped by the planning of a later run (see
+    `plan_windows`), even if later months completed before it.
+
+    Args:
+        db: An SQLAlchemy engine.
+        profiles (list): The profiles of the run.
+        planned (dict): The jobs of each profile (by `watermark_key`), in
+          chronological order.
+        done (dict): The results of the completed jobs (see
+          `loop_profiles`).
+        marks (dict): The marks already written, by `watermark_key`. It is
+          updated in place.
+    """
+    for profile in profiles:
+        key = watermark_key(profile)
+        found = []
+        for job in planned.get(key, []):
+            if job not in done:
+                break
+            found.append(done[job].get('marks', {}).get(key))
+        found = [x for x in found if x]
+        if not found or max(found) == marks.get(key):
+            continue
+        marks[key] = max(found)
+        with db.connect() as con:
+            write_watermark(con, profile, date.fromisoformat(marks[key]))
+
+
+def load_profiles(path: Optional[str] = None) -> list:
+    """Returns the ingestion profiles.
+
+    A profile is a dict with the `query` to search for, the `language` and
+    `country` of the feed, and the `table` its articles are written to.
+    Several profiles can write to the same table, e.g. related queries in
+    the same language.
+
+    Args:
+        path (Optional[str]): A JSON file with a list of profiles. Defaults
+          to `PROFILES`.
+
+    Returns:
+        list: The profiles.
+    """
+    if path is None:
+        return [dict(x) for x in PROFILES]
+    with open(path) as j:
+        profiles = json.load(j)
+    for profile in profiles:
+        missing = [x for x in PROFILE_KEYS if not profile.get(x)]
+        if missing:
+            raise ValueError(f'Profile {profile} is missing: '
+                             f'{", ".join(missing)}')
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', profile['table']):
+            raise ValueError(f'Invalid table name: {profile["table"]}')
+    return profiles
+
+
+def job_id(year: int, month: int, profiles: list) -> str:
+    """Returns the id of the job fetching a month for a set of profiles.
+
+    The id ends with a hash of the (table, `watermark_key`) of each profile,
+    so a run with other profiles does not skip the months completed by a
+    previous run with the same run id.
+    """
+    keys = sorted(f'{x["table"]}/{watermark_key(x)}' for x in profiles)
+    digest = _hash('\n'.join(keys))[:8]
+    return f'{year}-{month:02d}-{digest}'
+
+
+def plan_months(db, profiles: list, incremental: bool,
+                lookback_days: int) -> list:
+    """Groups the windows of all the profiles by month.
+
+    Returns:
+        list: (year, month, profiles) tuples in chronological order, with
+          the profiles that fetch each month (see `plan_windows`).
+    """
+    months = defaultdict(list)
+    tables = Counter(profile['table'] for profile in profiles)
+    for profile in profiles:
+        for window in plan_windows(db, profile, incremental, lookback_days,
+                                   tables[profile['table']] > 1):
+            months[window].append(profile)
+    return [(year, month, months[(year, month)])
+            for year, month in sorted(months)]
+
+
+def google_news(incremental: bool = False,
+                lookback_days: int = 30,
+                workers: int = 4,
+                run_id: Optional[str] = None,
+                profiles: Optional[list] = None):
+    signal.signal(signal.SIGINT, keyboard_interrupt_handler)
 
-    for language, vals in languages.items():
-        for year in tqdm(range(2010, 2024), desc='Years'):
-
-            futures = []
-            for month in range(1, 13):
-                futures.append(loop.remote(vals, year, month))
-
-            presents = []
-            for future in tqdm(futures, desc='Futures'):
-                presents.append(ray.get(future))
-
-            for df in tqdm(presents, desc='Presents'):
-                if df is not None:
-                    existing_ids = []
-                    try:
-                        for idx in df.index:
-                            res = db.execute(
-                                f'SELECT index FROM articles WHERE \'{idx}\' ~ '
-                                'index;').one_or_none()
-                            if res:
-                                existing_ids.append(idx)
-                    except sqlalchemy.exc.ProgrammingError:
-                        pass
-                    df = df[~df.index.isin(existing_ids)]
-                    df.to_sql(vals['table'],
-                              db,
-                              if_exists='append',
-                              index=True)
+    engine = DB(os.environ['POSTGRES_CON_STRING']).select('postgres')
+    db = engine.connect()
+
+    profiles = profiles or load_profiles()
+    for table in dict.fromkeys(profile['table'] for profile in profiles):
+        ensure_articles_table(db, table)
+        if date_bounds(db, table)[0] is None:
+            rebuild_daily_counts(db, table)
+
+    jobs = []
+    for year, month, month_profiles in plan_months(db, profiles, incremental,
+                                                   lookback_days):
+        jobs.append((job_id(year, month, month_profiles),
+                     (month_profiles, year, month)))
+    db.close()
+    # Profiles -> their jobs, in chronological order
+    planned = defaultdict(list)
+    for job, (month_profiles, _, _) in jobs:
+        for profile in month_profiles:
+            planned[watermark_key(profile)].append(job)
+
+    # Start the NLP workers before the scheduler threads
+    article_nlp.get_pool()
+    run_id = run_id or date.today().isoformat()
+    scheduler = JobScheduler(run_id, workers)
+    # The months that completed in a previous attempt of this run count too
+    done = scheduler.results()
+    marks = {}
+    advance_watermarks(engine, profiles, planned, done, marks)
+    remaining = len({job for job, _ in jobs} - set(done))
+    for job, result, error in tqdm(scheduler.run(loop_profiles, jobs),
+                                   total=remaining,
+                                   desc='Months'):
+        if error:
+            tqdm.write(f'{job}: failed\n{error}')
+            continue
+        done[job] = result
+        advance_watermarks(engine, profiles, planned, done, marks)
+        tables = ', '.join(f'{table} +{counts[0]} ({counts[1]} existing)'
+                           for table, counts in result['tables'].items())
+        tqdm.write(f'{job}: {result["links"]} articles '
+                   f'({result["shared"]} shared), {tables} '
+                   f'({result["rows_per_second"] or 0} rows/s)')
+    if metrics.enabled():
+        print('Metrics:',
+              metrics.write_report(f'data/metrics/daily-{run_id}.json'))
 
 
 def bing_news():
@@ -192,22 +593,54 @@ def bing_news():
             df['published'] = df['published'].apply(lambda x: x.date())
             df.set_index('index', inplace=True)
 
-            existing_ids = []
-            q_p = 'SELECT index FROM articles WHERE'
-            for idx in df.index:
-                q = f'{q_p} \'{idx}\' ~ index;'
-                res = db.execute(q).fetchall()
-                if res:
-                    existing_ids.append(idx)
-            df = df[~df.index.isin(existing_ids)]
+            df = df[~df.index.isin(existing_ids(db, 'articles', df.index))]
         except Exception as e:
             print('Unexpected exception!', '>' * 58)
             print(e)
             print('<' * 58, 'Unexpected exception!')
 
 
+def _opts():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only fetch the months at or after the last '
+                        'ingested date of each language/query')
+    parser.add_argument('--lookback-days',
+                        type=int,
+                        default=30,
+                        help='Days before the high-water mark to fetch '
+                        'again for late-indexed stories (default: 30)')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=4,
+                        help='Number of months fetched at the same time '
+                        '(default: 4)')
+    parser.add_argument('--run-id',
+                        help='Identifier of the run; jobs that completed in '
+                        'a previous run with the same id and profiles are '
+                        'skipped (default: today\'s date)')
+    parser.add_argument('--profiles',
+                        help='JSON file with a list of (table, language, '
+                        'country, query) profiles, fetched together '
+                        '(default: English and Spanish)')
+    parser.add_argument('--metrics',
+                        action='store_true',
+                        help='Time each stage of the ingestion, and write '
+                        'a JSON report to data/metrics/ at the end of the '
+                        'run (also enabled by COYOTE_METRICS=1)')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    args = _opts()
+    if args.metrics:
+        metrics.enable()
     load_dotenv()
     nltk.download('punkt')
-    google_news()
+    google_news(incremental=args.incremental,
+                lookback_days=args.lookback_days,
+                workers=args.workers,
+                run_id=args.run_id,
+                profiles=load_profiles(args.profiles))
     # bing_news()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+import sqlalchemy
+
+import metrics
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+# The text search configuration (i.e., the stemming language) of each table
+TEXT_SEARCH_CONFIGS = {'articles': 'english', 'articles_es': 'spanish'}
+
+
+class DB:
+    """Access to the Postgres databases shared by the ingest job and the app.
+
+    Every `DB.select` call for the same connection string and database
+    returns the same engine, so each process keeps a single connection pool.
+    The pool can be tuned with the `DB_POOL_SIZE`, `DB_MAX_OVERFLOW`,
+    `DB_POOL_TIMEOUT` and `DB_POOL_RECYCLE` environment variables.
+    """
+    def __init__(self, conn_string):
+        self.conn_string = conn_string
+
+    def select(self, db_name):
+        """Returns the pooled engine of a database.
+
+        Check out a connection with `engine.connect()` (preferably in a
+        `with` block) for each unit of work; closing it returns it to the
+        pool.
+        """
+        key = (self.conn_string, db_name)
+        with _engines_lock:
+            if key not in _engines:
+                args = {
+                    'dbname': db_name,
+                    # 'sslrootcert': 'certs/DigiCertGlobalRootCA.crt.pem',
+                    # 'sslmode': 'verify-full'
+                }
+                _engines[key] = sqlalchemy.create_engine(
+                    self.conn_string,
+                    connect_args=args,
+                    pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+                    max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+                    pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                    pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+                    pool_pre_ping=True)
+            return _engines[key]
+
+
+def ensure_daily_counts(db) -> None:
+    """Creates the per-(table, day) article counts summary table."""
+    db.execute('CREATE TABLE IF NOT EXISTS article_daily_counts ('
+               'table_name text, day date, articles integer NOT NULL, '
+               'PRIMARY KEY (table_name, day));')
+
+
+def _copy_field(value) -> str:
+    """Formats a value as a field of the `COPY` text format."""
+    if value is None or value != value:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_buffer(df: pd.DataFrame) -> io.StringIO:
+    """Serializes a frame and its index for `COPY FROM STDIN`.
+
+    The rows are written in the `COPY` text format, column by column, which
+    is several times faster than `DataFrame.to_csv`.
+    """
+    columns = [list(map(_copy_field, df.index))]
+    columns.extend(list(map(_copy_field, df[x])) for x in df.columns)
+    buffer = io.StringIO()
+    buffer.writelines(f'{line}\n' for line in map('\t'.join, zip(*columns)))
+    buffer.seek(0)
+    return buffer
+
+
+def copy_merge(db, table: str, df: pd.DataFrame) -> tuple:
+    """Bulk loads a frame of articles, skipping the hashes already stored.
+
+    The rows are streamed with `COPY FROM STDIN` from an in-memory buffer
+    (see `copy_buffer`) into a temporary staging table, then merged into
+    `table` with a single `INSERT ... ON CONFLICT ("index") DO NOTHING`
+    statement, which also adds the inserted rows to the daily counts.
+    Everything runs in one transaction, in three round trips whatever the
+    number of rows.
+
+    The table and the daily counts must exist (see `ensure_articles_table`),
+    so nothing else is sent per batch.
+
+    Args:
+        db: An open SQLAlchemy connection.
+        table (str): The name of the articles table.
+        df (pd.DataFrame): Articles indexed by their md5 hash, with columns
+          of `table`.
+
+    Returns:
+        tuple: The number of inserted rows, and the time it took in seconds.
+    """
+    start = time.monotonic()
+    columns = ', '.join(f'"{x}"' for x in ['index', *df.columns])
+    buffer = copy_buffer(df)
+    with db.begin():
+        cursor = db.connection.cursor()
+        cursor.execute(f'CREATE TEMP TABLE {table}_staging (LIKE {table}) '
+                       'ON COMMIT DROP;')
+        cursor.copy_expert(f'COPY {table}_staging ({columns}) FROM STDIN;',
+                           buffer)
+        cursor.execute(
+            f'WITH inserted AS (INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {table}_staging '
+            'ON CONFLICT ("index") DO NOTHING RETURNING published), '
+            'counted AS (INSERT INTO article_daily_counts '
+            'SELECT %(table)s, published, count(*) FROM inserted '
+            'WHERE published IS NOT NULL GROUP BY published '
+            'ON CONFLICT (table_name, day) DO UPDATE SET '
+            'articles = article_daily_counts.articles + EXCLUDED.articles) '
+            'SELECT count(*) FROM inserted;', {'table': table})
+        inserted = cursor.fetchone()[0]
+        cursor.close()
+    seconds = time.monotonic() - start
+    metrics.observe('db_write_seconds', seconds)
+    metrics.inc('db_rows_written_total', inserted)
+    metrics.inc('db_rows_skipped_total', len(df) - inserted)
+    return inserted, seconds
+
+
+def rebuild_daily_counts(db, table: str) -> None:
+    """Recomputes the daily counts of a table from its rows."""
+    ensure_daily_counts(db)
+    with db.begin():
+        db.execute(
+            sqlalchemy.text(
+                'DELETE FROM article_daily_counts WHERE table_name = :table;'
+            ), {'table': table})
+        db.execute(
+            sqlalchemy.text(
+                'INSERT INTO article_daily_counts SELECT :table, '
+                f'published::date, count(*) FROM {table} '
+                'WHERE published IS NOT NULL GROUP BY published::date;'),
+            {'table': table})
+
+
+def date_bounds(db, table: str) -> tuple:
+    """Returns the first and last published dates of a table.
+
+    Returns:
+        tuple: (first, last) dates, or (None, None) if there is no summary.
+    """
+    if not sqlalchemy.inspect(db).has_table('article_daily_counts'):
+        return None, None
+    return tuple(
+        db.execute(
+            sqlalchemy.text('SELECT min(day), max(day) FROM '
+                            'article_daily_counts WHERE table_name = :table;'),
+            {'table': table}).one())
+
+
+def daily_counts(db, table: str, from_date, to_date) -> pd.DataFrame:
+    """Returns the number of articles per day of a table in a date range."""
+    return pd.read_sql(sqlalchemy.text(
+        'SELECT day, articles FROM article_daily_counts WHERE '
+        'table_name = :table AND day BETWEEN :from_date AND :to_date '
+        'ORDER BY day;'),
+                       db,
+                       params={
+                           'table': table,
+                           'from_date': str(from_date),
+                           'to_date': str(to_date)
+                       },
+                       index_col='day')
+
+
+def ensure_articles_table(db, table: str) -> None:
+    """Creates an articles table, or migrates it to the managed schema.
+
+    Tables created by `DataFrame.to_sql` have a text `published` column, no
+    uniqueness constraint on the article hash and only a plain index. The
+    migration converts `published` to a native `date` in place, removes the
+    duplicated hashes (keeping the first row), and adds a unique index on
+    `index` and a btree index on `published`. It also adds the `cluster`
+    column of near-duplicate articles (see `near_duplicates`), with its
+    index, and the `search` full-text column (see `search_articles`), and
+    creates the daily counts summary (see `ensure_daily_counts`). It is
+    idempotent, and runs in a single transaction.
+
+    Args:
+        db: An open SQLAlchemy connection.
+        table (str): The name of the articles table.
+    """
+    with db.begin():
+        db.execute(f'CREATE TABLE IF NOT EXISTS {table} ('
+                   '"index" text NOT NULL, title text, link text, '
+                   'published date, keywords text, summary text, '
+                   'cluster text);')
+        db.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS '
+                   'cluster text;')
+        published_type = db.execute(
+            sqlalchemy.text(
+                'SELECT data_type FROM information_schema.columns WHERE '
+                'table_name = :table AND column_name = :column;'), {
+                    'table': table,
+                    'column': 'published'
+                }).scalar()
+        if published_type != 'date':
+            db.execute(f'ALTER TABLE {table} ALTER COLUMN published '
+                       'TYPE date USING published::date;')
+        indexes = {
+            index['name']
+            for index in sqlalchemy.inspect(db).get_indexes(table)
+        }
+        deduplicated = False
+        if f'{table}_index_key' not in indexes:
+            deduplicated = db.execute(
+                f'DELETE FROM {table} a USING {table} b WHERE '
+                'a."index" = b."index" AND a.ctid > b.ctid;').rowcount > 0
+            db.execute(f'CREATE UNIQUE INDEX {table}_index_key '
+                       f'ON {table} ("index");')
+            # Superseded by the unique index
+            db.execute(f'DROP INDEX IF EXISTS ix_{table}_index;')
+            db.execute(f'DROP INDEX IF EXISTS {table}_index_idx;')
+        db.execute(f'CREATE INDEX IF NOT EXISTS {table}_published_idx '
+                   f'ON {table} (published);')
+        db.execute(f'CREATE INDEX IF NOT EXISTS {table}_cluster_idx '
+                   f'ON {table} (cluster);')
+        ensure_search_index(db, table)
+        ensure_daily_counts(db)
+    if deduplicated:
+        rebuild_daily_counts(db, table)
+
+
+def ensure_search_index(db, table: str) -> None:
+    """Adds the full-text search column of an articles table, and its index.
+
+    `search` is a `tsvector` generated from the title (weighted highest),
+    keywords and summary of each row, so Postgres maintains it on every
+    insert. It is stemmed with the configuration of the table in
+    `TEXT_SEARCH_CONFIGS` ("simple" for other tables), and indexed with GIN.
+    Adding it to an existing table fills it for every row, once.
+    """
+    config = TEXT_SEARCH_CONFIGS.get(table, 'simple')
+    db.execute(
+        f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search tsvector '
+        'GENERATED ALWAYS AS ('
+        f"setweight(to_tsvector('{config}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{config}', coalesce(keywords, '')), 'B') || "
+        f"setweight(to_tsvector('{config}', coalesce(summary, '')), 'C')"
+        ') STORED;')
+    db.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_idx '
+               f'ON {table} USING gin (search);')
+
+
+def _search_sql(table: str) -> str:
+    config = TEXT_SEARCH_CONFIGS.get(table, 'simple')
+    return (f"FROM {table}, websearch_to_tsquery('{config}', :query) query "
+            'WHERE search @@ query AND published BETWEEN :from_date '
+            'AND :to_date')
+
+
+def count_matches(db, table: str, query: str, from_date, to_date) -> int:
+    """Returns the number of articles matching a full-text search."""
+    return db.execute(
+        sqlalchemy.text(f'SELECT count(*) {_search_sql(table)};'), {
+            'query': query,
+            'from_date': str(from_date),
+            'to_date': str(to_date)
+        }).scalar()
+
+
+def search_articles(db,
+                    table: str,
+                    query: str,
+                    from_date,
+                    to_date,
+                    limit: int = 100,
+                    offset: int = 0) -> pd.DataFrame:
+    """Searches the title, keywords and summary of the articles of a table.
+
+    Args:
+        db: An open SQLAlchemy connection.
+        table (str): The name of the articles table.
+        query (str): A web search style query, e.g. `bite child park`,
+          `"bit a child" -dog` or `park or trail`.
+        from_date: The first published date.
+        to_date: The last published date.
+        limit (int, optional): The number of rows. Defaults to 100.
+        offset (int, optional): The number of rows to skip. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: The matching articles, the best ranked first.
+    """
+    return pd.read_sql(sqlalchemy.text(
+        'SELECT "index", title, link, published, keywords, summary, '
+        f'ts_rank(search, query) AS rank {_search_sql(table)} '
+        'ORDER BY rank DESC, published DESC, "index" '
+        'LIMIT :limit OFFSET :offset;'),
+                       db,
+                       params={
+                           'query': query,
+                           'from_date': str(from_date),
+                           'to_date': str(to_date),
+                           'limit': limit,
+                           'offset': offset
+                       })
@@ -5,24 +5,31 @@ import calendar
 import concurrent.futures
 import json
 import os
-import shutil
-import sys
-import tempfile
+import threading
+import time
+import uuid
 import warnings
-from collections import defaultdict, namedtuple
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, timedelta, timezone
 from pathlib import Path
-from typing import NamedTuple, Type, NoReturn, Union
+from typing import (TYPE_CHECKING, Iterator, NamedTuple, Type, NoReturn,
+                    Optional, Union)
+from urllib.parse import urlsplit
 
-import dill
-import grip
-import newspaper
-import nltk
-import pandas as pd
-from pygooglenews import GoogleNews
-from rich.console import Console
+import metrics
+from html_export import FRONT_MATTER, parse_published, render_html
+
+# The heavy dependencies (pandas, pygooglenews, nltk, newspaper, aiohttp,
+# dill, rich) are imported by the stages that use them, so importing this
+# module (e.g. by the web app) stays fast.
+if TYPE_CHECKING:
+    import pandas as pd
+    from pygooglenews import GoogleNews
 
 warnings.filterwarnings('ignore')
 
+FEED_CAP = 100
+
 
 class NoEntriesExit(SystemExit):
     pass
@@ -32,8 +39,43 @@ class Count:
     count = None
 
 
+class RateLimiter:
+    """Spaces out calls so that at most `rate` calls per second start.
+
+    One limiter is shared by every thread that sends requests to the same
+    host (see `RateLimiter.for_host`).
+    """
+    _hosts = {}
+    _hosts_lock = threading.Lock()
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self._next = 0.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host: str, rate: float) -> 'RateLimiter':
+        """Returns the limiter shared by all the requests to a host."""
+        with cls._hosts_lock:
+            if host not in cls._hosts:
+                cls._hosts[host] = cls(rate)
+            return cls._hosts[host]
+
+    def wait(self) -> None:
+        """Blocks until the next call is allowed to start."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
 class Search:
     def __init__(self, query, month, year, language, country, testing, silent,
+                 cache=None, fetcher=None, nlp_workers=None, nlp_batch_size=4,
+                 feed_workers=8, feed_rate=5., feed_url=None, progress=None,
+                 duplicates=None, nlp_executor=None, summarizer=None,
                  **kwargs) -> None:
         self.query = query
         self.month = month
@@ -42,6 +84,23 @@ class Search:
         self.country = country.upper()
         self.testing = testing
         self.silent = silent
+        self.cache = cache
+        # A `near_duplicates.NearDuplicateIndex`
+        self.duplicates = duplicates
+        self.fetcher = fetcher
+        self.nlp_workers = nlp_workers
+        self.nlp_batch_size = nlp_batch_size
+        # Runs the NLP batches instead of the shared process pool
+        self.nlp_executor = nlp_executor
+        # Replaces `article_nlp.summarize_batch` (e.g., in tests)
+        self.summarizer = summarizer
+        self.feed_workers = feed_workers
+        self.feed_rate = feed_rate
+        # Overrides the Google News RSS endpoint (e.g., for benchmarks)
+        self.feed_url = feed_url or os.environ.get('GOOGLE_NEWS_RSS_URL')
+        self.request_log = []
+        # Called with the `iter_articles` counts as they change
+        self.progress = progress
 
     def create_date(self) -> int:
         """Creates formatted date string.
@@ -65,99 +124,215 @@ class Search:
             last_day = 30
         return last_day
 
+    @staticmethod
+    def split_window(start: date, end: date) -> list:
+        """Bisects a [start, end) date window.
+
+        Args:
+            start (date): The first day of the window.
+            end (date): The day after the last day of the window.
+
+        Returns:
+            list: Two (from, to) halves, or an empty list if the window is a
+              single day (the smallest window Google News supports).
+        """
+        days = (end - start).days
+        if days <= 1:
+            return []
+        mid = start + timedelta(days=days // 2)
+        return [(start, mid), (mid, end)]
+
+    @staticmethod
+    def merge_entries(*entries_lists: list) -> list:
+        """Merges lists of feed entries, dropping duplicates by id/link."""
+        seen = set()
+        merged = []
+        for entries in entries_lists:
+            for entry in entries:
+                key = entry.get('id') or entry.get('link')
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(entry)
+        return merged
+
+    def search_window(self, gn: 'GoogleNews', start: date,
+                      end: date) -> dict:
+        """Sends one Google News search for the [start, end) window.
+
+        Requests to the same host are throttled to `self.feed_rate` requests
+        per second, across all threads.
+        """
+        RateLimiter.for_host(urlsplit(gn.BASE_URL).netloc,
+                             self.feed_rate).wait()
+        metrics.inc('feed_requests_total')
+        with metrics.timer('feed_request_seconds'):
+            res = gn.search(self.query,
+                            from_=start.isoformat(),
+                            to_=end.isoformat())
+        metrics.inc('feed_entries_total', len(res['entries']))
+        return res
+
+    def adaptive_search(self, gn: 'GoogleNews', start: date, end: date,
+                        first: dict = None) -> list:
+        """Fetches every entry of a date window with the fewest requests.
+
+        Any window that returns `FEED_CAP` entries (i.e., it was truncated)
+        is bisected, and the halves are requested again, until every window
+        is below the cap or is a single day. Windows are requested level by
+        level, concurrently, by up to `self.feed_workers` threads. Sparse
+        windows are never split, so they cost a single request.
+
+        Each request is recorded in `self.request_log`.
+
+        Args:
+            gn (GoogleNews): The Google News client.
+            start (date): The first day of the window.
+            end (date): The day after the last day of the window.
+            first (dict, optional): The response already received for the
+              whole window, if any.
+
+        Returns:
+            list: The merged entries of all the requested windows.
+        """
+        pending = [(start, end, first)]
+        found = []
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.feed_workers) as executor:
+            while pending:
+                todo = [(x, y) for x, y, res in pending if res is None]
+                fetched = dict(
+                    zip(todo,
+                        executor.map(
+                            lambda window: self.search_window(gn, *window),
+                            todo)))
+                next_level = []
+                for x, y, res in pending:
+                    if res is None:
+                        res = fetched[(x, y)]
+                    halves = []
+                    if len(res['entries']) >= FEED_CAP:
+                        halves = Search.split_window(x, y)
+                    self.request_log.append({
+                        'from': x.isoformat(),
+                        'to': y.isoformat(),
+                        'entries': len(res['entries']),
+                        'split': bool(halves)
+                    })
+                    found.append(res['entries'])
+                    next_level.extend((a, b, None) for a, b in halves)
+                pending = next_level
+        return Search.merge_entries(*found)
+
     def request(self) -> dict:
         """Fetches news articles from Google News.
 
         Searches for news articles using Google News API. If self.month has
-        more than 100 entries, a separate request for each day of the month is
-        sent (will only retrieve the first 100 entries if there is > 100
-        entry in a given day).
+        100 entries or more (the maximum number of entries per response), the
+        month is bisected adaptively until no window is truncated (see
+        `Search.adaptive_search`). Only a single day that has more than 100
+        entries is still truncated.
 
         Returns:
             dict: A dictionary with metadata of the news articles.
         """
+        from pygooglenews import GoogleNews
+        from rich.console import Console
+
         console = Console()
         gn = GoogleNews(lang=self.language, country=self.country)
+        if self.feed_url:
+            gn.BASE_URL = self.feed_url
 
         last_day = Search.create_date(self)
-        from_ = f'{self.year}-{self.month}-01'
-        to_ = f'{self.year}-{self.month}-{last_day}'
+        start = date(int(self.year), int(self.month), 1)
+        end = start + timedelta(days=last_day)
         month_name = calendar.month_name[int(self.month)]
         console.rule(f'{month_name}, {self.year}')
 
-        res = gn.search(self.query, from_=from_, to_=to_)
+        self.request_log = []
+        res = self.search_window(gn, start, end)
         count = len(res['entries'])
         if count == 0:
             Count.count = 0
-        if count == 100:
-            console.print(f'Found +{count} articles')
+        if count >= FEED_CAP:
+            res['entries'] = self.adaptive_search(gn, start, end, first=res)
+            console.print(f'Found {len(res["entries"])} articles '
+                          f'({len(self.request_log)} requests)')
         else:
             console.print(f'Found {count} articles')
-        if count >= 100:
-            res['entries'].clear()
-            for day in range(1, last_day):
-                if day <= 9:
-                    if day != 9:
-                        next_day = f'0{day + 1}'
-                    day = f'0{day}'
-                else:
-                    next_day = day + 1
-                res_1 = gn.search(self.query,
-                                  from_=f'{self.year}-{self.month}-{day}',
-                                  to_=f'{self.year}-{self.month}-'
-                                  f'{next_day}')  # noqa
-                res['entries'].extend(res_1['entries'])
         return res
 
-    def improve_results(self, raw_data: dict) -> dict:
-        """Improves the raw results retrieved from Google News.
+    @staticmethod
+    def clean_entry(article: dict) -> dict:
+        """Removes the redundant keys of a raw feed entry."""
+        exclude_keys = [
+            'title_detail', 'links', 'summary_detail', 'guidislink',
+            'sub_articles', 'published_parsed', 'summary'
+        ]
+        return {k: v for k, v in article.items() if k not in exclude_keys}
 
-        Removes redundant and unnecessary data from the API response,
-        and uses `Newspaper3k` to summarize the article and extract
-        keywords.
+    def apply_parsed(self, article: dict, parsed: Optional[dict]) -> dict:
+        """Adds the keywords and the summary of a parsed article.
 
         Args:
-            raw_data (dict): Data dictionary retrieved from `Search.request`.
+            article (dict): A single clean article dictionary.
+            parsed (Optional[dict]): The output of `article_nlp.parse_article`
+              for this article, or None if it could not be parsed.
 
         Returns:
-            dict: A dictionary with the clean/improved data
+            dict: The article dictionary, with its keywords and summary.
         """
-        def iterate_over_articles(article: dict) -> dict:
-            """Helper function for iterating through articles.
-
-            Inner function to be used later in a concurrent.futures loop to
-            execute calls asynchronously.
-
-            Args:
-                article (dict): A single article dictionary.
-
-            Returns:
-                dict: A clean and improved dictionary with data from the raw
-                  dictionary.
-            """
-            exclude_keys = [
-                'title_detail', 'links', 'summary_detail', 'guidislink',
-                'sub_articles', 'published_parsed', 'summary'
-            ]
-            article = {
-                k: v
-                for k, v in article.items() if k not in exclude_keys
-            }
-
-            article_obj = newspaper.Article(article['link'],
-                                            language=self.language)
-            try:
-                article_obj.download()
-                article_obj.parse()
-                article_obj.nlp()
-                article['keywords'] = article_obj.keywords
-                article['summary'] = article_obj.summary
-            except newspaper.article.ArticleException:
-                if not self.silent:
-                    print(f'Skipped nlp for {article["title"]}...')
-                article['keywords'] = []
-                article['summary'] = ''
+        if parsed is None:
+            if not self.silent:
+                print(f'Skipped nlp for {article["title"]}...')
+            article['keywords'] = []
+            article['summary'] = ''
             return article
+        article['keywords'] = parsed['keywords']
+        article['summary'] = parsed['summary']
+        return article
+
+    def iter_articles(self, raw_data: Optional[dict] = None) -> Iterator[dict]:
+        """Yields the improved articles as soon as each one is ready.
+
+        Removes redundant and unnecessary data from the API response,
+        and uses `Newspaper3k` to summarize the article and extract
+        keywords. Articles found in `self.cache` (an `ArticleCache`) are
+        neither downloaded nor summarized again, and are yielded first.
+        If `self.progress` is set, it is called with the number of
+        `entries`, and of `cached`, `fetched` and `parsed` articles so far,
+        every time one of them changes.
+
+        The other articles are downloaded concurrently by `self.fetcher` (an
+        `AsyncFetcher`). The pages are sent, in batches of
+        `self.nlp_batch_size`, to a pool of `self.nlp_workers` processes (or
+        to `self.nlp_executor`) that parse and summarize them while the rest
+        are still downloading.
+
+        If `self.duplicates` (a `NearDuplicateIndex`) is set, the pages are
+        parsed first, and only the articles that are not near-duplicates of
+        an already processed one are summarized (see
+        `near_duplicates.ClusterState`). The others reuse the keywords and
+        summary of their cluster. Each article then has a `cluster`, the id
+        of the cluster it belongs to.
+
+        Args:
+            raw_data (Optional[dict]): Data dictionary retrieved from
+              `Search.request`. Defaults to a new request.
+
+        Yields:
+            dict: A clean and improved article dictionary, in completion
+              order.
+        """
+        import nltk
+
+        import article_nlp
+        from article_fetcher import AsyncFetcher
+        from near_duplicates import ClusterState
+
+        if raw_data is None:
+            raw_data = self.request()
 
         try:
             nltk.data.find('tokenizers/punkt')
@@ -165,17 +340,132 @@ class Search:
             print('NLTK: resource punkt not found! Downloading...')
             nltk.download('punkt')
 
+        counts = Counter(entries=len(raw_data['entries']))
+
+        def report(**increments) -> None:
+            counts.update(increments)
+            if self.progress is not None:
+                self.progress(dict(counts))
+
+        report()
+        pending = defaultdict(list)
+        for article in map(Search.clean_entry, raw_data['entries']):
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get(article['link'])
+            if cached is None:
+                pending[article['link']].append(article)
+            else:
+                report(cached=1)
+                metrics.inc('article_cache_hits_total')
+                if self.duplicates is not None:
+                    article['cluster'] = self.duplicates.cluster_of(
+                        article['link'])
+                yield self.apply_parsed(article, cached)
+        if not pending:
+            return
+
+        pool = self.nlp_executor or article_nlp.get_pool(self.nlp_workers)
+        summarize = self.summarizer or article_nlp.summarize_batch
+        fetcher = self.fetcher or AsyncFetcher()
+        running = {}
+        clusters = None
+        if self.duplicates is not None:
+            clusters = ClusterState(self.duplicates)
+        to_summarize = []
+        # Links -> the time their page was received
+        fetched_at = {}
+
+        def submit(fn, batch: list) -> None:
+            running[pool.submit(fn, batch, self.language)] = fn
+
+        def finish(link: str, parsed: Optional[dict]) -> Iterator[dict]:
+            report(parsed=1)
+            metrics.inc('articles_parsed_total' if parsed is not None else
+                        'articles_failed_total')
+            if link in fetched_at:
+                metrics.observe('article_latency_seconds',
+                                time.perf_counter() - fetched_at.pop(link))
+            if parsed is not None and self.cache is not None:
+                self.cache.put(link, parsed['text'], parsed['keywords'],
+                               parsed['summary'])
+            for article in pending[link]:
+                if clusters is not None:
+                    article['cluster'] = clusters.cluster(link)
+                yield self.apply_parsed(article, parsed)
+
+        def duplicates(done: list) -> Iterator[dict]:
+            for link, parsed in done:
+                report(duplicates=1)
+                metrics.inc('near_duplicates_total')
+                yield from finish(link, parsed)
+
+        def collect(future: concurrent.futures.Future) -> Iterator[dict]:
+            fn = running.pop(future)
+            for link, result, timings in future.result():
+                for stage, seconds in timings.items():
+                    metrics.observe(f'article_{stage}_seconds', seconds)
+                if fn is article_nlp.extract_batch and result is not None:
+                    parsed, summarizing = clusters.match(link, result)
+                    if parsed is not None:
+                        yield from duplicates([(link, parsed)])
+                    elif summarizing:
+                        to_summarize.append(
+                            (link, result['title'], result['text']))
+                    continue
+                yield from finish(link, result)
+                if fn is not summarize:
+                    continue
+                if result is not None:
+                    yield from duplicates(
+                        clusters.representative_done(link, result))
+                    continue
+                promoted = clusters.representative_failed(link)
+                if promoted is not None:
+                    link, extracted = promoted
+                    to_summarize.append(
+                        (link, extracted['title'], extracted['text']))
+            while len(to_summarize) >= self.nlp_batch_size:
+                submit(summarize, to_summarize[:self.nlp_batch_size])
+                del to_summarize[:self.nlp_batch_size]
+
+        first_stage = (article_nlp.parse_batch if self.duplicates is None
+                       else article_nlp.extract_batch)
+        batch = []
+        for page in fetcher.fetch(list(pending)):
+            report(fetched=1)
+            fetched_at[page[0]] = time.perf_counter()
+            batch.append(page)
+            if len(batch) >= self.nlp_batch_size:
+                submit(first_stage, batch)
+                batch = []
+            for future in [x for x in running if x.done()]:
+                yield from collect(future)
+        if batch:
+            submit(first_stage, batch)
+        while running or to_summarize:
+            if to_summarize:
+                submit(summarize, to_summarize[:])
+                to_summarize.clear()
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield from collect(future)
+
+    def improve_results(self, raw_data: dict) -> dict:
+        """Improves the raw results retrieved from Google News.
+
+        Collects the output of `Search.iter_articles`.
+
+        Args:
+            raw_data (dict): Data dictionary retrieved from `Search.request`.
+
+        Returns:
+            dict: A dictionary with the clean/improved data
+        """
         output_dict = defaultdict(dict)
         output_dict['feed'] = raw_data['feed']
-        output_dict['results']['entries'] = entries = []
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = [
-                executor.submit(iterate_over_articles, article)
-                for article in raw_data['entries']
-            ]
-            for future in concurrent.futures.as_completed(results):
-                entries.append(future.result())
+        output_dict['results']['entries'] = list(self.iter_articles(raw_data))
         return output_dict
 
     def filename(self) -> str:
@@ -200,7 +490,7 @@ class Search:
 
         Args:
             subdir (str): The data type: "json", "json/raw", "html",
-              "pickle", or "excel".
+              "pickle", "excel", or "parquet/<month>".
             gh_pages (bool, optional): whether the output  should be
               directly exported to the github pages website directory.
               Defaults to False.
@@ -299,21 +589,54 @@ class ExportData(Search):
     def style_keywords(keywords_: list) -> str:
         return ', '.join([f'`{keyword}`' for keyword in sorted(keywords_)])
 
-    def _to_pandas(self) -> pd.DataFrame:
+    def _to_pandas(self) -> 'pd.DataFrame':
         """Converts the output from dictionary to Pandas dataframe.
 
         Returns:
             pd.DataFrame: Pandas dataframe with the dictionary keys as columns.
         """
-        df = pd.DataFrame.from_dict(self.data.improved['results']['entries'])
-        df.columns = df.columns.str.capitalize()
-        df['Published'] = pd.to_datetime(df.Published).dt.date
-        df.sort_values('Published', inplace=True)
-        df.replace(r'\\n', ' ', regex=True, inplace=True)
-        df.reset_index(inplace=True)
-        df.pop('index')
+        return ExportData.articles_to_pandas(
+            self.data.improved['results']['entries'])
+
+    @staticmethod
+    def articles_to_pandas(articles: list) -> 'pd.DataFrame':
+        """Converts a list of improved articles to Pandas dataframe.
+
+        Can be called on each chunk yielded by `Search.iter_articles`.
+
+        Args:
+            articles (list): A list of improved article dictionaries.
+
+        Returns:
+            pd.DataFrame: Pandas dataframe with the dictionary keys as columns.
+        """
+        import pandas as pd
+
+        import transforms
+
+        with metrics.timer('dataframe_build_seconds'):
+            df = pd.DataFrame.from_dict(articles)
+            df.columns = df.columns.str.capitalize()
+            df['Published'] = pd.to_datetime(df.Published).dt.date
+            df.sort_values('Published', inplace=True)
+            transforms.replace_escaped_newlines(df)
+            df.reset_index(inplace=True)
+            df.pop('index')
         return df
 
+    @staticmethod
+    def sort_by_published(articles: list) -> list:
+        """Sorts improved articles by date, the undated ones last."""
+        def published(article: dict) -> tuple:
+            date_ = parse_published(article.get('published'))
+            if date_ is None:
+                return True, 0
+            if date_.tzinfo is None:
+                date_ = date_.replace(tzinfo=timezone.utc)
+            return False, date_.timestamp()
+
+        return sorted(articles, key=published)
+
     def to_excel(self) -> None:
         """Exports the output to an excel sheet."""
         path = Search.mkdir_ifnot(self, 'excel')
@@ -335,70 +658,234 @@ class ExportData(Search):
 
     def to_pickle(self) -> None:
         """Exports the output to a pickle file."""
+        import dill
+
         path = Search.mkdir_ifnot(self, 'pickle')
         d = self.data(self.data.raw, self.data.improved)
         with open(f'{path}/{self.fname}.pkl', 'wb') as pkl:
             dill.dump(d, pkl)
 
+    def to_parquet(self, compression: str = 'zstd') -> str:
+        """Appends the improved data to the Parquet archive.
+
+        Each export writes a new compressed file to
+        `data/{year}/parquet/{month}/{LANGUAGE}/`, so exporting the same
+        month again appends to it instead of overwriting it. The rows carry
+        the query, language, country, year and month, and all the files
+        share `PARQUET_SCHEMA`, so the whole archive can be read and
+        filtered as one dataset with `read_parquet_archive`.
+
+        Args:
+            compression (str, optional): The Parquet compression codec.
+              Defaults to "zstd".
+
+        Returns:
+            str: The path to the written file.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = Search.mkdir_ifnot(self, f'parquet/{self.month}')
+        rows = []
+        for article in self.data.improved['results']['entries']:
+            source = article.get('source') or {}
+            published = pd.to_datetime(article.get('published'),
+                                       utc=True,
+                                       errors='coerce')
+            rows.append({
+                'id': article.get('id'),
+                'title': article.get('title'),
+                'link': article.get('link'),
+                'published': None if pd.isna(published) else published,
+                'source': {
+                    'href': source.get('href'),
+                    'title': source.get('title')
+                },
+                'keywords': list(article.get('keywords') or []),
+                'summary': article.get('summary'),
+                'query': self.query,
+                'language': self.language,
+                'country': self.country,
+                'year': int(self.year),
+                'month': int(self.month)
+            })
+        table = pa.Table.from_pylist(rows, schema=parquet_schema())
+        out = f'{path}/{self.fname}-{uuid.uuid4().hex[:8]}.parquet'
+        pq.write_table(table, out, compression=compression)
+        return out
+
+    def to_markdown(self) -> str:
+        """Exports the data to a markdown file, with the Jekyll front matter.
+
+        Returns:
+            str: The path to the markdown file.
+        """
+        import transforms
+
+        df = ExportData._to_pandas(self)
+        df['Summary'] = transforms.clean_text(df.Summary)
+        df['Title'] = transforms.clean_text(df.Title)
+        df['Link'] = transforms.md_links(df.Link)
+        df['Source'] = transforms.md_sources(df.Source)
+        df.pop('Id')
+        path_md = Search.mkdir_ifnot(self, 'md')
+        md_path = f'{path_md}/{self.fname}.md'
+        with open(md_path, 'w') as f:
+            f.write(FRONT_MATTER.substitute(self.front_matter()))
+            f.write(f'Query: `{self.query}`\n\n\n')
+            f.write(df.to_markdown())
+        return md_path
+
+    def front_matter(self) -> dict:
+        """Returns the GitHub Pages title and permalink of this export."""
+        return {
+            'title': self.fname,
+            'permalink': f'/{self.year}/{self.language.upper()}/{self.fname}'
+        }
+
     def to_html(self, keep_md: bool = False, to_ghpages: bool = False) -> list:
         """Exports the data to html files.
 
-        Convert output to markdown using GitHub markdown API, then create
-        html tables from the markdown files.
+        Renders the articles, sorted by date, as an html table with a local
+        template (see `html_export.render_html`), without any network call.
 
         Args:
-            keep_md (bool, optional): Whether the markdown files should be
-              kept. Defaults to False.
+            keep_md (bool, optional): Whether a markdown file should also be
+              exported. Defaults to False.
             to_ghpages (bool, optional): Whether to export the generated
-              html files to the github pages directory in the project.
+              html files to the github pages directory in the project. That
+              copy starts with the Jekyll front matter and only contains the
+              table.
 
         Returns:
             list: A list containing the html file lines.
         """
-        df = ExportData._to_pandas(self)
-        df['Summary'] = df.Summary.apply(self.remove_bad_chars)
-        df['Title'] = df.Title.apply(self.remove_bad_chars)
-        df['Link'] = df.Link.apply(self.md_link)
-        df['Source'] = df.Source.apply(self.source)
-        df.pop('Id')
-        md = df.to_markdown()
+        articles = ExportData.sort_by_published(
+            self.data.improved['results']['entries'])
         path = Search.mkdir_ifnot(self, 'html')
-        html_path = f'{path}/{self.fname}.html'
-        new_name = f'{self.month}_{self.year} - {self.query}'
-        with tempfile.NamedTemporaryFile() as fp:
-            fp.write('---\nlayout: default\ntitle:  results_2020_01\n'.encode(
-                'utf-8'))
-            fp.write(
-                'permalink: /2020/EN/results_2020_01\n---\n\n'.encode('utf-8'))
-            fp.write(f'Query: `{self.query}`\n\n\n'.encode('utf-8'))
-            fp.write(md.encode('utf-8'))
-            fp.seek(0)
-            fp.read().decode('utf-8')
-            if keep_md:
-                path_md = Search.mkdir_ifnot(self, 'md')
-                os.link(fp.name, f'{path_md}/{self.fname}.md')
-            warnings.simplefilter("ignore", ResourceWarning)
-            grip.export(path=fp.name,
-                        out_filename=html_path,
-                        title=new_name,
-                        quiet=True)
-            with open(html_path, 'r+') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if 'GitHub rate limit reached - Grip' in line:
-                        html_path = html_path.replace('.html', '.md')
-                        shutil.copy2(fp.name, html_path)
-                        with open(html_path, 'r+') as f2:
-                            lines = f2.readlines()
-                        break
-
-        stdout = sys.stdout
-        with open(os.devnull, 'w') as f:
-            sys.stdout = f
-            grip.clear_cache()
-        sys.stdout = stdout
-
+        title = f'{self.month}_{self.year} - {self.query}'
+        with open(f'{path}/{self.fname}.html', 'w', encoding='utf-8') as f:
+            lines = []
+            for line in render_html(articles, title, self.query):
+                f.write(line)
+                lines.append(line)
+
+        if keep_md:
+            ExportData.to_markdown(self)
         if to_ghpages:
             gh_path = Search.mkdir_ifnot(self, '', gh_pages=True)
-            shutil.copy2(html_path, gh_path)
+            with open(f'{gh_path}/{self.fname}.html', 'w',
+                      encoding='utf-8') as f:
+                f.writelines(
+                    render_html(articles,
+                                title,
+                                self.query,
+                                front_matter=self.front_matter()))
         return lines
+
+
+def parquet_schema():
+    """Returns the schema shared by all the files of the Parquet archive."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.string()),
+        ('title', pa.string()),
+        ('link', pa.string()),
+        ('published', pa.timestamp('s', tz='UTC')),
+        ('source', pa.struct([('href', pa.string()), ('title', pa.string())])),
+        ('keywords', pa.list_(pa.string())),
+        ('summary', pa.string()),
+        ('query', pa.string()),
+        ('language', pa.string()),
+        ('country', pa.string()),
+        ('year', pa.int16()),
+        ('month', pa.int8()),
+    ])
+
+
+def read_parquet_archive(root: str = 'data',
+                         columns: list = None,
+                         predicate=None,
+                         year: int = None,
+                         month: int = None,
+                         language: str = None):
+    """Reads the Parquet archive written by `ExportData.to_parquet`.
+
+    The files are scanned as a single dataset, so only the requested
+    columns are read, and the predicate is applied while scanning. The
+    archive is partitioned by directory, so setting the year, month or
+    language skips the files of the other partitions without opening them.
+
+    Args:
+        root (str, optional): The data directory. Defaults to "data".
+        columns (list, optional): The columns to load. Defaults to all.
+        predicate (optional): A `pyarrow.dataset` expression, e.g.
+          `(ds.field('language') == 'en') & (ds.field('year') >= 2020)`.
+        year (int, optional): Only read this year. Defaults to all.
+        month (int, optional): Only read this month. Defaults to all.
+        language (str, optional): Only read this language. Defaults to all.
+
+    Returns:
+        pyarrow.Table: The matching rows.
+    """
+    import pyarrow.dataset as ds
+
+    pattern = '/'.join([
+        '*' if year is None else str(int(year)), 'parquet',
+        '*' if month is None else str(int(month)),
+        '*' if language is None else language.upper(), '*.parquet'
+    ])
+    files = sorted(str(x) for x in Path(root).glob(pattern))
+    if not files:
+        return parquet_schema().empty_table()
+    dataset = ds.dataset(files, schema=parquet_schema(), format='parquet')
+    return dataset.to_table(columns=columns, filter=predicate)
+
+
+def archived_articles(query: str,
+                      language: str,
+                      country: str,
+                      year: int,
+                      month: int,
+                      root: str = 'data') -> list:
+    """Returns the archived articles of a search, without any network call.
+
+    Reads the rows exported by `ExportData.to_parquet` for the exact query,
+    language, country and month, from the directory of that month and
+    language only. A month exported more than once is deduplicated by
+    article link.
+
+    Args:
+        query (str): The search query.
+        language (str): The language of the search.
+        country (str): The country of the search.
+        year (int): The year of the search.
+        month (int): The month of the search.
+        root (str, optional): The data directory. Defaults to "data".
+
+    Returns:
+        list: Improved article dictionaries (empty if the search was never
+          archived).
+    """
+    import pyarrow.dataset as ds
+
+    table = read_parquet_archive(
+        root,
+        columns=[
+            'id', 'title', 'link', 'published', 'source', 'keywords',
+            'summary'
+        ],
+        predicate=((ds.field('query') == query)
+                   & (ds.field('language') == language)
+                   & (ds.field('country') == country)
+                   & (ds.field('year') == int(year))
+                   & (ds.field('month') == int(month))),
+        year=year,
+        month=month,
+        language=language)
+    articles = {}
+    for article in table.to_pylist():
+        articles.setdefault(article['link'], article)
+    return list(articles.values())
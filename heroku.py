@@ -1,10 +1,28 @@
+import json
 import os
+import time
+from datetime import date
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
 
 import bottle
 
-from google_news_api import Search, ExportData
+import metrics
+from article_cache import ArticleCache
+from google_news_api import (Search, ExportData, NoEntriesExit,
+                             archived_articles)
+from html_export import render_html
+from jobs import JobQueue
+from result_cache import ResultCache
 
 app = bottle.Bottle()
+cache = ArticleCache()
+results = ResultCache(ttl=float(os.environ.get('SEARCH_CACHE_TTL', 60 * 60)))
+# Processes parsing and summarizing the articles of the searches
+nlp_workers = int(os.environ.get('SEARCH_NLP_WORKERS', 2))
+# Served at /metrics; set COYOTE_METRICS=0 to turn off
+if os.environ.get('COYOTE_METRICS') != '0':
+    metrics.enable()
 
 
 @bottle.get('/search')
@@ -19,29 +37,166 @@ def search_func():
     '''
 
 
+def render_search(kwargs: dict) -> str:
+    """Renders the html results of a search.
+
+    Searches of past months that were exported to the Parquet archive are
+    rendered from it, without any network call. Other searches run the
+    full pipeline, and past months are then archived for the next time.
+    """
+    query, month, year = kwargs['query'], kwargs['month'], kwargs['year']
+    title = f'{month}_{year} - {query}'
+    today = date.today()
+    past = (year, month) < (today.year, today.month)
+    if past:
+        articles = archived_articles(query, kwargs['language'],
+                                     kwargs['country'], year, month)
+        if articles:
+            return ''.join(
+                render_html(ExportData.sort_by_published(articles), title,
+                            query))
+
+    search = Search(**kwargs)
+    try:
+        export = ExportData(search.run(), **kwargs)
+    except NoEntriesExit:
+        return ''.join(render_html([], title, query))
+    lines = export.to_html()
+    if past:
+        export.to_parquet()
+    return ''.join(lines)
+
+
+def run_job(params: dict, progress) -> str:
+    """Runs a search job of the queue (see `JobQueue`)."""
+    kwargs = {
+        **params, 'testing': False,
+        'silent': True,
+        'cache': cache,
+        'nlp_workers': nlp_workers,
+        'progress': progress
+    }
+    key = (params['query'], params['month'], params['year'],
+           params['language'], params['country'])
+    return results.get_or_compute(key, lambda: render_search(kwargs))
+
+
+queue = JobQueue(run_job, workers=int(os.environ.get('SEARCH_WORKERS', 2)))
+
+PROGRESS_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><meta http-equiv="refresh" content="2"></head>
+<body><p>Search <code>{id}</code> is {status}: {progress}</p></body>
+</html>
+"""
+
+
+def _wants_json() -> bool:
+    return 'application/json' in bottle.request.get_header('Accept', '')
+
+
+def _job_or_404(job_id: str) -> dict:
+    status = queue.status(job_id)
+    if status is None:
+        bottle.abort(404, f'No job {job_id}')
+    return status
+
+
 @bottle.post('/search')
 def do_search():
-    query = bottle.request.forms.get('query')
-    month = int(bottle.request.forms.get('month'))
-    year = int(bottle.request.forms.get('year'))
-    kwargs = {
-        'query': query,
-        'month': month,
-        'year': year,
-        'lang': 'es',
-        'country': 'US',
-        'testing': False,
-        'silent': True
+    """Queues a search and returns its job id, without waiting for it.
+
+    JSON clients get the job id and URLs with a 202; browsers are
+    redirected to the result page, which refreshes until the job is done.
+    """
+    params = {
+        'query': bottle.request.forms.get('query'),
+        'month': int(bottle.request.forms.get('month')),
+        'year': int(bottle.request.forms.get('year')),
+        'language': 'es',
+        'country': 'US'
     }
-    search = Search(**kwargs)
-    results = search.run()
-    export = ExportData(results, **kwargs)
-    lines = export.to_html()
-    lines = ''.join(lines)
-    return lines
+    job_id = queue.submit(params)
+    if not _wants_json():
+        bottle.redirect(f'/jobs/{job_id}/result', 303)
+    bottle.response.status = 202
+    bottle.response.content_type = 'application/json'
+    return json.dumps({
+        'id': job_id,
+        'status': f'/jobs/{job_id}',
+        'events': f'/jobs/{job_id}/events',
+        'result': f'/jobs/{job_id}/result'
+    })
+
+
+@bottle.get('/jobs/<job_id>')
+def job_status(job_id):
+    bottle.response.content_type = 'application/json'
+    return json.dumps(_job_or_404(job_id))
+
+
+@bottle.get('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Streams the status of a job as server-sent events until it ends."""
+    _job_or_404(job_id)
+    bottle.response.content_type = 'text/event-stream'
+    bottle.response.set_header('Cache-Control', 'no-cache')
+
+    def events():
+        last = None
+        while True:
+            status = queue.status(job_id)
+            if status != last:
+                yield f'data: {json.dumps(status)}\n\n'
+                last = status
+            if status['status'] in ('done', 'failed'):
+                return
+            time.sleep(1)
+
+    return events()
+
+
+@bottle.get('/jobs/<job_id>/result')
+def job_result(job_id):
+    status = _job_or_404(job_id)
+    if status['status'] == 'done':
+        return queue.result(job_id)
+    if status['status'] == 'failed':
+        bottle.abort(500, 'The search failed')
+    bottle.response.status = 202
+    return PROGRESS_PAGE.format(id=job_id,
+                                status=status['status'],
+                                progress=json.dumps(status['progress']))
+
+
+@bottle.get('/metrics')
+def metrics_page():
+    """Exposes the timers and counters in the Prometheus text format."""
+    bottle.response.content_type = 'text/plain; version=0.0.4'
+    return metrics.prometheus()
+
+
+class ThreadingWSGIRefServer(bottle.ServerAdapter):
+    """The wsgiref server, with one thread per request."""
+    def run(self, app):
+        class Server(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+
+        class Handler(WSGIRequestHandler):
+            def log_request(*args, **kwargs):
+                if not self.quiet:
+                    return WSGIRequestHandler.log_request(*args, **kwargs)
+
+        make_server(self.host, self.port, app, Server,
+                    Handler).serve_forever()
 
 
 if os.environ.get('APP_LOCATION') == 'heroku':
-    bottle.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+    bottle.run(server=ThreadingWSGIRefServer,
+               host="0.0.0.0",
+               port=int(os.environ.get("PORT", 5000)))
 else:
-    bottle.run(host='localhost', port=8080, debug=True)
+    bottle.run(server=ThreadingWSGIRefServer,
+               host='localhost',
+               port=8080,
+               debug=True)
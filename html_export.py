@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import email.utils
+import html
+from datetime import datetime
+from string import Template
+from typing import Iterable, Iterator, Optional
+
+FRONT_MATTER = Template('---\nlayout: default\ntitle:  $title\n'
+                        'permalink: $permalink\n---\n\n')
+
+PAGE_HEAD = Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+body {font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif;
+      margin: 2em;}
+table {border-collapse: collapse;}
+th, td {border: 1px solid #dfe2e5; padding: 6px 13px; vertical-align: top;}
+tr:nth-child(2n) {background-color: #f6f8fa;}
+code {background-color: rgba(27, 31, 35, .05); padding: .2em .4em;}
+</style>
+</head>
+<body>
+''')
+
+PAGE_TAIL = '</body>\n</html>\n'
+
+TABLE_HEAD = Template('''<p>Query: <code>$query</code></p>
+<table>
+<thead>
+<tr><th></th><th>Title</th><th>Link</th><th>Published</th><th>Source</th>\
+<th>Keywords</th><th>Summary</th></tr>
+</thead>
+<tbody>
+''')
+
+TABLE_TAIL = '</tbody>\n</table>\n'
+
+ROW = Template('<tr><td>$n</td><td>$title</td><td><a href="$link">Link</a></td>'
+               '<td>$published</td><td><a href="$source_link">$source</a></td>'
+               '<td>$keywords</td><td>$summary</td></tr>\n')
+
+
+def parse_published(value) -> Optional[datetime]:
+    """Parses the publication date of an article.
+
+    Feed dates (RFC 822) and ISO dates are parsed with the standard library,
+    so rendering a page does not import pandas. Other values fall back to
+    `pd.to_datetime`.
+
+    Returns:
+        Optional[datetime]: The date, or None if it is missing or invalid.
+    """
+    if value is None or value == '':
+        return
+    if isinstance(value, datetime):
+        # NaT is a datetime that is not equal to itself
+        return value if value == value else None
+    if isinstance(value, str):
+        try:
+            return email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            pass
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    import pandas as pd
+
+    published = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(published) else published.to_pydatetime()
+
+
+def _published(value) -> str:
+    published = parse_published(value)
+    return '' if published is None else str(published.date())
+
+
+def _text(value) -> str:
+    # Some feeds and pages contain literal "\\n" sequences
+    return html.escape((value or '').replace('\\n', ' '))
+
+
+def render_rows(articles: Iterable[dict]) -> Iterator[str]:
+    """Renders each improved article as an HTML table row.
+
+    Args:
+        articles (Iterable[dict]): Improved article dictionaries, e.g. from
+          `Search.iter_articles`.
+
+    Yields:
+        str: One `<tr>` line per article.
+    """
+    esc = html.escape
+    for n, article in enumerate(articles):
+        source = article.get('source') or {}
+        keywords = ', '.join(f'<code>{esc(x)}</code>'
+                             for x in sorted(article.get('keywords') or []))
+        yield ROW.substitute(n=n,
+                             title=_text(article.get('title')),
+                             link=esc(article.get('link') or ''),
+                             published=_published(article.get('published')),
+                             source_link=esc(source.get('href') or ''),
+                             source=_text(source.get('title')),
+                             keywords=keywords,
+                             summary=_text(article.get('summary')))
+
+
+def render_html(articles: Iterable[dict],
+                title: str,
+                query: str,
+                front_matter: Optional[dict] = None) -> Iterator[str]:
+    """Renders improved articles as an HTML table, without any network call.
+
+    Args:
+        articles (Iterable[dict]): Improved article dictionaries. They are
+          rendered as they are consumed.
+        title (str): The title of the page.
+        query (str): The search query, shown above the table.
+        front_matter (Optional[dict]): The `title` and `permalink` of a
+          GitHub Pages page. If given, the output starts with the Jekyll
+          front matter and only contains the table (the layout provides the
+          rest of the page). Otherwise, a standalone HTML document is
+          rendered.
+
+    Yields:
+        str: The lines of the HTML output.
+    """
+    if front_matter:
+        yield FRONT_MATTER.substitute(front_matter)
+    else:
+        yield PAGE_HEAD.substitute(title=html.escape(title))
+    yield TABLE_HEAD.substitute(query=html.escape(query))
+    yield from render_rows(articles)
+    yield TABLE_TAIL
+    if not front_matter:
+        yield PAGE_TAIL
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class JobQueue:
+    """A persistent queue of background jobs, run by a bounded thread pool.
+
+    Jobs are stored in a SQLite database and picked up, oldest first, by
+    `workers` threads, so submitting a job returns immediately whatever the
+    load. Submitting the same parameters as a job that is still queued or
+    running returns that job instead of a new one. Finished jobs are
+    deleted after `retention` seconds.
+
+    The queue can be shared by several processes. Each one claims jobs
+    under its own owner id, and refreshes the heartbeat of its running jobs
+    every `heartbeat_interval` seconds. A running job whose heartbeat is
+    older than three intervals (e.g., its process crashed or was restarted)
+    is claimed again by any process.
+
+    Args:
+        fn (Callable): Runs a job, as `fn(params, progress)`, and returns its
+          result as a string. `progress` can be called with a JSON-
+          serializable dictionary to report the progress of the job.
+        workers (int): The number of jobs that run at the same time.
+        path (str): The path to the queue database.
+        retention (float): How long finished jobs are kept, in seconds.
+        progress_interval (float): The minimum time between two progress
+          writes of a job, in seconds.
+        heartbeat_interval (float): The time between two heartbeats of the
+          running jobs, in seconds.
+    """
+    def __init__(self,
+                 fn: Callable[[dict, Callable[[dict], None]], str],
+                 workers: int = 2,
+                 path: str = 'data/web_jobs.sqlite3',
+                 retention: float = 60 * 60 * 24 * 7,
+                 progress_interval: float = 0.5,
+                 heartbeat_interval: float = 10) -> None:
+        self.fn = fn
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self._beating = threading.Event()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path,
+                                    timeout=30,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL;')
+        self._con.execute('CREATE TABLE IF NOT EXISTS queue ('
+                          'id TEXT PRIMARY KEY, key TEXT, params TEXT, '
+                          'status TEXT, progress TEXT, result TEXT, '
+                          'error TEXT, created_at REAL, updated_at REAL);')
+        self._con.execute('CREATE INDEX IF NOT EXISTS queue_status '
+                          'ON queue (status, created_at);')
+        self._con.execute('CREATE INDEX IF NOT EXISTS queue_key '
+                          'ON queue (key);')
+        columns = {row[1] for row in self._con.execute(
+            'PRAGMA table_info(queue);')}
+        for column, type_ in (('owner', 'TEXT'), ('heartbeat', 'REAL')):
+            if column not in columns:
+                self._con.execute(
+                    f'ALTER TABLE queue ADD COLUMN {column} {type_};')
+        self._con.execute(
+            'DELETE FROM queue WHERE status IN (?, ?) AND updated_at < ?;',
+            ('done', 'failed', time.time() - retention))
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(workers)
+        ]
+        self._threads.append(
+            threading.Thread(target=self._heartbeat, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, params: dict) -> str:
+        """Queues a job, unless the same job is already queued or running.
+
+        Args:
+            params (dict): The JSON-serializable parameters of the job.
+
+        Returns:
+            str: The id of the job.
+        """
+        key = json.dumps(params, sort_keys=True)
+        with self._lock:
+            row = self._con.execute(
+                'SELECT id FROM queue WHERE key = ? AND status IN (?, ?) '
+                'ORDER BY created_at LIMIT 1;',
+                (key, 'queued', 'running')).fetchone()
+            if row is not None:
+                return row[0]
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self._con.execute(
+                'INSERT INTO queue (id, key, params, status, progress, '
+                'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?);',
+                (job_id, key, key, 'queued', '{}', now, now))
+            self._wakeup.notify()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Returns the status of a job, or None if it does not exist.
+
+        The status is one of "queued", "running", "done" and "failed".
+        """
+        with self._lock:
+            row = self._con.execute(
+                'SELECT params, status, progress, error, created_at, '
+                'updated_at FROM queue WHERE id = ?;', (job_id, )).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': job_id,
+            'params': json.loads(row[0]),
+            'status': row[1],
+            'progress': json.loads(row[2]),
+            'error': row[3],
+            'created_at': row[4],
+            'updated_at': row[5]
+        }
+
+    def result(self, job_id: str) -> Optional[str]:
+        """Returns the result of a job, or None if it is not done."""
+        with self._lock:
+            row = self._con.execute(
+                'SELECT result FROM queue WHERE id = ? AND status = ?;',
+                (job_id, 'done')).fetchone()
+        return None if row is None else row[0]
+
+    def stop(self) -> None:
+        """Stops the workers once their current job is finished."""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        self._beating.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _update(self, job_id: str, **values) -> None:
+        # A job claimed again by another process is no longer ours
+        columns = ', '.join(f'{column} = ?' for column in values)
+        with self._lock:
+            self._con.execute(
+                f'UPDATE queue SET {columns}, updated_at = ? '
+                'WHERE id = ? AND owner = ?;',
+                (*values.values(), time.time(), job_id, self.owner))
+
+    def _heartbeat(self) -> None:
+        while not self._beating.wait(self.heartbeat_interval):
+            with self._lock:
+                self._con.execute(
+                    'UPDATE queue SET heartbeat = ? '
+                    'WHERE owner = ? AND status = ?;',
+                    (time.time(), self.owner, 'running'))
+
+    def _claim(self) -> Optional[tuple]:
+        """Claims the oldest queued or abandoned job, and returns it."""
+        claimable = ('(status = ? OR (status = ? AND '
+                     '(heartbeat IS NULL OR heartbeat < ?)))')
+        while True:
+            now = time.time()
+            args = ('queued', 'running', now - 3 * self.heartbeat_interval)
+            row = self._con.execute(
+                f'SELECT id, params FROM queue WHERE {claimable} '
+                'ORDER BY created_at LIMIT 1;', args).fetchone()
+            if row is None:
+                return None
+            # Another process sharing the queue may have claimed it first
+            if self._con.execute(
+                    'UPDATE queue SET status = ?, owner = ?, heartbeat = ?, '
+                    f'updated_at = ? WHERE id = ? AND {claimable};',
+                ('running', self.owner, now, now, row[0], *args)).rowcount:
+                return row[0], json.loads(row[1])
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                job = self._claim()
+                while job is None and not self._stopped:
+                    self._wakeup.wait(timeout=5)
+                    job = self._claim()
+                if self._stopped:
+                    if job is not None:
+                        self._con.execute(
+                            'UPDATE queue SET status = ?, owner = NULL '
+                            'WHERE id = ?;', ('queued', job[0]))
+                    return
+            self._run(*job)
+
+    def _run(self, job_id: str, params: dict) -> None:
+        last = 0.
+        latest = {}
+
+        def progress(values: dict) -> None:
+            nonlocal last, latest
+            latest = values
+            if time.monotonic() - last >= self.progress_interval:
+                last = time.monotonic()
+                self._update(job_id, progress=json.dumps(values))
+
+        try:
+            result = self.fn(params, progress)
+        except BaseException:  # noqa
+            self._update(job_id,
+                         status='failed',
+                         progress=json.dumps(latest),
+                         error=traceback.format_exc())
+            return
+        self._update(job_id,
+                     status='done',
+                     progress=json.dumps(latest),
+                     result=result)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Process-wide counters, timers and histograms.
+
+Metrics are disabled by default, and every call is then a no-op that
+returns after checking a flag. They are enabled by `enable()` or by setting
+the `COYOTE_METRICS` environment variable (to anything but "0").
+
+Examples:
+    >>> metrics.inc('feed_requests_total')
+    >>> with metrics.timer('db_write_seconds'):
+    ...     write()
+    >>> metrics.observe('article_parse_seconds', 0.12)
+    >>> print(metrics.prometheus())
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+PREFIX = 'coyote_'
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+_enabled = os.environ.get('COYOTE_METRICS', '0') not in ('', '0')
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket of a quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable(flag: bool = True) -> None:
+    """Turns the collection of metrics on (or off)."""
+    global _enabled
+    _enabled = flag
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Adds to a counter."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Records a value (usually a duration, in seconds) in a histogram."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.observe(value)
+
+
+def timer(name: str):
+    """Returns a context manager that records its duration in a histogram."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def reset() -> None:
+    """Clears every metric."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def report() -> dict:
+    """Returns the counters, and a summary of each histogram."""
+    with _lock:
+        return {
+            'counters': dict(sorted(_counters.items())),
+            'histograms': {
+                name: {
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'mean': round(h.sum / h.count, 6) if h.count else 0.,
+                    'p50': round(h.quantile(.5), 6),
+                    'p95': round(h.quantile(.95), 6),
+                    'p99': round(h.quantile(.99), 6),
+                    'max': round(h.max, 6)
+                }
+                for name, h in sorted(_histograms.items())
+            }
+        }
+
+
+def write_report(path: str) -> str:
+    """Writes `report()` to a JSON file, and returns its path."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as j:
+        json.dump(report(), j, indent=4)
+    return path
+
+
+def prometheus() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            lines.append(f'{PREFIX}{name} {value:g}')
+        for name, h in sorted(_histograms.items()):
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.buckets):
+                cumulative += n
+                lines.append(
+                    f'{PREFIX}{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f'{PREFIX}{name}_sum {h.sum:g}')
+            lines.append(f'{PREFIX}{name}_count {h.count}')
+    return '\n'.join(lines) + '\n'
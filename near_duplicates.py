@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import metrics
+from article_cache import canonical_link
+
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 3
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(20100101)
+_A = _rng.randint(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Returns the set of lowercase word n-grams of a text."""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {
+        ' '.join(words[i:i + size])
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """Computes the MinHash signature of a text.
+
+    Two signatures agree on each of their `NUM_PERM` values with a
+    probability equal to the Jaccard similarity of the word shingles of the
+    two texts.
+
+    Args:
+        text (str): The text, e.g. the title and text of an article.
+
+    Returns:
+        Optional[np.ndarray]: The uint32 signature, or None if the text has
+          no words.
+    """
+    words = shingles(text)
+    if not words:
+        return
+    hashes = np.fromiter((zlib.crc32(x.encode('utf-8')) for x in words),
+                         dtype=np.uint64,
+                         count=len(words))
+    permuted = (np.outer(hashes, _A) + _B) % _MERSENNE
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimates the Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(a == b))
+
+
+def cluster_id(link: str) -> str:
+    """Returns the id of the cluster represented by an article."""
+    return hashlib.md5(canonical_link(link).encode('utf-8')).hexdigest()
+
+
+class NearDuplicateIndex:
+    """A persistent LSH index of the MinHash signatures of articles.
+
+    Each signature is split into `BANDS` bands, and articles sharing any
+    band are compared. An article whose estimated similarity with an indexed
+    one reaches `threshold` is a near-duplicate, and belongs to its
+    cluster. With 16 bands of 8 values, pairs at 0.8 similarity are found
+    95% of the time, and pairs below 0.5 very rarely.
+
+    The index is a SQLite database, so clusters (and the summary and
+    keywords of their first article) carry over between runs. The oldest
+    entries are evicted once it holds more than `max_entries` articles.
+    """
+    def __init__(self,
+                 path: str = 'data/cache/near_duplicates.sqlite3',
+                 threshold: float = 0.8,
+                 max_entries: int = 200_000) -> None:
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._adds = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path,
+                                    timeout=30,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL;')
+        self._con.execute('CREATE TABLE IF NOT EXISTS signatures ('
+                          'link TEXT PRIMARY KEY, cluster TEXT, '
+                          'signature BLOB, keywords TEXT, summary TEXT, '
+                          'added_at REAL);')
+        self._con.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                          'band INTEGER, bucket BLOB, link TEXT);')
+        self._con.execute('CREATE INDEX IF NOT EXISTS buckets_band_bucket '
+                          'ON buckets (band, bucket);')
+        self._con.execute('CREATE INDEX IF NOT EXISTS buckets_link '
+                          'ON buckets (link);')
+
+    @staticmethod
+    def _bands(signature: np.ndarray) -> list:
+        rows = len(signature) // BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes())
+                for band in range(BANDS)]
+
+    def query(self, signature: np.ndarray) -> Optional[dict]:
+        """Finds the most similar indexed article, if it is a near-duplicate.
+
+        Args:
+            signature (np.ndarray): The MinHash signature of an article.
+
+        Returns:
+            Optional[dict]: The `link`, `cluster`, `similarity`, `keywords`
+              and `summary` of the match, or None. `keywords` and `summary`
+              are None until they are set with `set_content`.
+        """
+        with self._lock:
+            candidates = set()
+            for band, bucket in self._bands(signature):
+                candidates.update(row[0] for row in self._con.execute(
+                    'SELECT link FROM buckets WHERE band = ? AND bucket = ?;',
+                    (band, bucket)))
+            rows = [
+                self._con.execute(
+                    'SELECT link, cluster, signature, keywords, summary '
+                    'FROM signatures WHERE link = ?;', (link, )).fetchone()
+                for link in candidates
+            ]
+        best = None
+        for row in filter(None, rows):
+            score = similarity(signature,
+                               np.frombuffer(row[2], dtype=np.uint32))
+            if score >= self.threshold and (best is None
+                                            or score > best['similarity']):
+                best = {
+                    'link': row[0],
+                    'cluster': row[1],
+                    'similarity': score,
+                    'keywords': None if row[3] is None else json.loads(row[3]),
+                    'summary': row[4]
+                }
+        return best
+
+    def add(self,
+            link: str,
+            signature: np.ndarray,
+            cluster: Optional[str] = None,
+            keywords: Optional[list] = None,
+            summary: Optional[str] = None) -> str:
+        """Indexes an article.
+
+        Args:
+            link (str): The article link.
+            signature (np.ndarray): The MinHash signature of the article.
+            cluster (Optional[str]): The cluster of the article. Defaults to
+              a new cluster, represented by this article.
+            keywords (Optional[list]): The keywords of the article, if they
+              are already known (see `set_content`).
+            summary (Optional[str]): The summary of the article, if it is
+              already known.
+
+        Returns:
+            str: The cluster of the article.
+        """
+        key = canonical_link(link)
+        cluster = cluster or cluster_id(link)
+        with self._lock:
+            self._con.execute('BEGIN;')
+            self._con.execute('DELETE FROM buckets WHERE link = ?;', (key, ))
+            self._con.execute(
+                'INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?);',
+                (key, cluster, signature.astype(np.uint32).tobytes(),
+                 None if keywords is None else json.dumps(keywords), summary,
+                 time.time()))
+            self._con.executemany(
+                'INSERT INTO buckets VALUES (?, ?, ?);',
+                [(band, bucket, key)
+                 for band, bucket in self._bands(signature)])
+            self._con.execute('COMMIT;')
+            self._adds += 1
+            if self._adds % 100 == 0:
+                self._evict()
+        return cluster
+
+    def set_content(self, link: str, keywords: list, summary: str) -> None:
+        """Stores the keywords and summary of an indexed article."""
+        with self._lock:
+            self._con.execute(
+                'UPDATE signatures SET keywords = ?, summary = ? '
+                'WHERE link = ?;',
+                (json.dumps(keywords), summary, canonical_link(link)))
+
+    def cluster_of(self, link: str) -> Optional[str]:
+        """Returns the cluster of an indexed article, or None."""
+        with self._lock:
+            row = self._con.execute(
+                'SELECT cluster FROM signatures WHERE link = ?;',
+                (canonical_link(link), )).fetchone()
+        return None if row is None else row[0]
+
+    def _evict(self) -> None:
+        if self._con.execute(
+                'DELETE FROM signatures WHERE link IN (SELECT link FROM '
+                'signatures ORDER BY added_at DESC LIMIT -1 OFFSET ?);',
+            (self.max_entries, )).rowcount:
+            self._con.execute('DELETE FROM buckets WHERE link NOT IN '
+                              '(SELECT link FROM signatures);')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._con.execute(
+                'SELECT count(*) FROM signatures;').fetchone()[0]
+
+
+class ClusterState:
+    """The near-duplicate clusters of the articles of one search.
+
+    The parsed articles are matched against `index` (see `match`). The first
+    article of a cluster without a summary is its representative, and is
+    the only one summarized. The near-duplicates found in the meantime wait
+    for it, and get its keywords and summary when it is done (see
+    `representative_done`). If it cannot be summarized, the first waiting
+    near-duplicate is summarized instead (see `representative_failed`).
+    """
+    def __init__(self, index: NearDuplicateIndex) -> None:
+        self.index = index
+        # Links -> their cluster
+        self._clusters = {}
+        # Representatives -> the near-duplicates waiting for their content
+        self._waiting = {}
+        # Links without content yet -> their representative
+        self._representatives = {}
+
+    def cluster(self, link: str) -> Optional[str]:
+        """Returns the cluster of a matched article, or None."""
+        return self._clusters.get(link)
+
+    def match(self, link: str, extracted: dict) -> tuple:
+        """Adds a parsed article to the cluster of its near-duplicates.
+
+        Args:
+            link (str): The article link.
+            extracted (dict): The `title`, `text` and `signature` of the
+              article (see `article_nlp.extract_article`).
+
+        Returns:
+            tuple: The `text`, `keywords` and `summary` of the article if its
+              cluster already has content (else None), and whether the
+              article must be summarized, because it has no signature or is
+              the representative of a new cluster.
+        """
+        signature = extracted['signature']
+        if signature is None:
+            return None, True
+        with metrics.timer('dedup_query_seconds'):
+            match = self.index.query(signature)
+        key = canonical_link(link)
+        if match is not None and match['summary'] is not None:
+            self._clusters[link] = self.index.add(link, signature,
+                                                  match['cluster'],
+                                                  match['keywords'],
+                                                  match['summary'])
+            return {
+                'text': extracted['text'],
+                'keywords': match['keywords'],
+                'summary': match['summary']
+            }, False
+        if match is not None and match['link'] in self._representatives:
+            self._clusters[link] = self.index.add(link, signature,
+                                                  match['cluster'])
+            representative = self._representatives[match['link']]
+            self._representatives[key] = representative
+            self._waiting[representative].append((link, extracted))
+            return None, False
+        self._clusters[link] = self.index.add(link, signature)
+        self._representatives[key] = key
+        self._waiting[key] = []
+        return None, True
+
+    def representative_done(self, link: str, parsed: dict) -> list:
+        """Stores the content of a summarized article in its cluster.
+
+        Returns:
+            list: (link, parsed) pairs of the near-duplicates that were
+              waiting for it, with their own text, and its keywords and
+              summary.
+        """
+        key = canonical_link(link)
+        self.index.set_content(link, parsed['keywords'], parsed['summary'])
+        done = []
+        for duplicate, extracted in self._waiting.pop(key, []):
+            self.index.set_content(duplicate, parsed['keywords'],
+                                   parsed['summary'])
+            done.append((duplicate, {**parsed, 'text': extracted['text']}))
+        self._reassign(key, None)
+        return done
+
+    def representative_failed(self, link: str) -> Optional[tuple]:
+        """Replaces an article that could not be summarized.
+
+        The first near-duplicate waiting for it becomes the representative
+        of the cluster, and the others (and the next near-duplicates) wait
+        for it instead.
+
+        Returns:
+            Optional[tuple]: The (link, extracted) pair of the new
+              representative, to summarize, or None if none was waiting.
+        """
+        key = canonical_link(link)
+        members = self._waiting.pop(key, [])
+        if not members:
+            self._reassign(key, None)
+            return
+        promoted = canonical_link(members[0][0])
+        self._waiting[promoted] = members[1:]
+        self._reassign(key, promoted)
+        return members[0]
+
+    def _reassign(self, representative: str,
+                  replacement: Optional[str]) -> None:
+        for key in [
+                x for x, y in self._representatives.items()
+                if y == representative
+        ]:
+            if replacement is None:
+                del self._representatives[key]
+            else:
+                self._representatives[key] = replacement
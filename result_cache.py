@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class ResultCache:
+    """An in-memory TTL cache of computed results, with request coalescing.
+
+    `get_or_compute` returns the cached value of a key while it is fresh.
+    Otherwise, the first caller computes it and every concurrent caller
+    asking for the same key waits for that computation instead of starting
+    its own. Failed computations are not cached: the error is raised to all
+    the waiting callers, and the next call tries again.
+
+    Args:
+        ttl (float, optional): How long a result is served, in seconds.
+          Defaults to one hour.
+        max_entries (int, optional): The number of results kept; the least
+          recently used ones are dropped first. Defaults to 256.
+    """
+    def __init__(self, ttl: float = 60 * 60, max_entries: int = 256) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self,
+                       key: Hashable,
+                       compute: Callable[[], Any],
+                       ttl: float = None) -> Any:
+        """Returns the result of a key, computing it at most once at a time.
+
+        Args:
+            key (Hashable): The cache key.
+            compute (Callable[[], Any]): Computes the result on a miss.
+            ttl (float, optional): Overrides the default TTL of this result.
+
+        Returns:
+            Any: The cached or computed result.
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._results[key] = (expires, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            del self._in_flight[key]
+        future.set_result(result)
+        return result
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drops the cached result of a key."""
+        with self._lock:
+            self._results.pop(key, None)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._results),
+            'in_flight': len(self._in_flight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced
+        }
@@ -1,26 +1,37 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
+import functools
 import json
+import time
 
-import bullet
-from rich.console import Console
-
+import metrics
+from article_cache import ArticleCache
 from google_news_api import Search, ExportData, Count
 
 
-class Check(bullet.Check):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.min_choices = 1
+@functools.lru_cache()
+def check_prompt():
+    """Returns a `bullet.Check` prompt that needs at least one choice.
+
+    bullet is only imported (and the class defined) when a prompt is shown.
+    """
+    import bullet
+
+    class Check(bullet.Check):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.min_choices = 1
 
-    @bullet.keyhandler.register(bullet.charDef.NEWLINE_KEY)  # noqa
-    def accept(self):
-        if self.valid():
-            return super().accept()
+        @bullet.keyhandler.register(bullet.charDef.NEWLINE_KEY)  # noqa
+        def accept(self):
+            if self.valid():
+                return super().accept()
 
-    def valid(self):
-        return self.min_choices <= sum(1 for x in self.checked if x)
+        def valid(self):
+            return self.min_choices <= sum(1 for x in self.checked if x)
+
+    return Check
 
 
 def any2(string, lst):
@@ -28,6 +39,10 @@ def any2(string, lst):
 
 
 def main():
+    import bullet
+    from rich.console import Console
+
+    Check = check_prompt()
     cli = bullet.VerticalPrompt([
         bullet.Input('Query: '),
         bullet.Numbers('Month (integer): ', type=int),
@@ -43,7 +58,7 @@ def main():
     ]
     values = list(zip(*result))[1]
     kwargs = {k: v for k, v in zip(keys, values)}
-    kwargs.update({'testing': False, 'silent': True})
+    kwargs.update({'testing': False, 'silent': True, 'cache': ArticleCache()})
     search = Search(**kwargs)
     results = search.run()
     if Count.count == 0:
@@ -58,7 +73,7 @@ def main():
         export = ExportData(results, **kwargs)
         options = [
             'to HTML (.html)', 'to Pickle (.pkl)', 'to Excel ('
-            '.xlsx)', 'to JSON (.json)'
+            '.xlsx)', 'to JSON (.json)', 'to Parquet (.parquet)'
         ]
         cli_2 = Check(choices=options, check='  ✅ ')
         selected_options = cli_2.launch()
@@ -70,7 +85,17 @@ def main():
             export.to_excel()
         if any2('JSON', selected_options):
             export.to_json()
+        if any2('Parquet', selected_options):
+            export.to_parquet()
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        if metrics.enabled():
+            from rich.console import Console
+
+            Console().print(json.dumps(metrics.report(), indent=4))
+            metrics.write_report(
+                time.strftime('data/metrics/run-%Y%m%d-%H%M%S.json'))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Iterator
+
+
+class JobScheduler:
+    """Runs ingest jobs on a local thread pool and persists their status.
+
+    Jobs are queued on a single `ThreadPoolExecutor`, so an idle worker
+    always picks up the next pending job, whatever it is. Results are
+    yielded in completion order.
+
+    The status of every job of a run is stored in a SQLite database. When a
+    run with the same `run_id` is started again (e.g., after a crash), the
+    jobs that already completed are skipped, and the others are retried.
+
+    Args:
+        run_id (str): The identifier of the run.
+        workers (int): The number of jobs that run at the same time.
+        path (str): The path to the status database.
+    """
+    def __init__(self,
+                 run_id: str,
+                 workers: int = 4,
+                 path: str = 'data/ingest_jobs.sqlite3') -> None:
+        self.run_id = run_id
+        self.workers = workers
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path,
+                                    timeout=30,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self._con.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                          'run_id TEXT, job TEXT, status TEXT, result TEXT, '
+                          'error TEXT, updated_at REAL, '
+                          'PRIMARY KEY (run_id, job));')
+
+    def _set(self, job: str, status: str, result=None, error=None) -> None:
+        with self._lock:
+            self._con.execute(
+                'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?);',
+                (self.run_id, job, status, json.dumps(result), error,
+                 time.time()))
+
+    def completed(self) -> set:
+        """Returns the jobs of this run that already completed."""
+        with self._lock:
+            rows = self._con.execute(
+                'SELECT job FROM jobs WHERE run_id = ? AND status = ?;',
+                (self.run_id, 'done')).fetchall()
+        return {row[0] for row in rows}
+
+    def results(self) -> dict:
+        """Returns the results of the jobs of this run that completed."""
+        with self._lock:
+            rows = self._con.execute(
+                'SELECT job, result FROM jobs WHERE run_id = ? AND status = ?;',
+                (self.run_id, 'done')).fetchall()
+        return {job: json.loads(result) for job, result in rows}
+
+    def _call(self, fn: Callable, job: str, args: tuple) -> tuple:
+        self._set(job, 'running')
+        try:
+            result = fn(*args)
+        except Exception:  # noqa
+            error = traceback.format_exc()
+            self._set(job, 'failed', error=error)
+            return None, error
+        self._set(job, 'done', result=result)
+        return result, None
+
+    def run(self, fn: Callable, jobs: list) -> Iterator[tuple]:
+        """Runs `fn` on every job that did not complete in this run yet.
+
+        Args:
+            fn (Callable): The function that processes a job. It should
+              return a JSON-serializable result.
+            jobs (list): A list of (job, args) tuples, where `job` is a
+              unique string and `args` are the positional arguments of `fn`.
+
+        Yields:
+            tuple: (job, result, error) for each job, in completion order.
+              `error` is the traceback of the job if it failed, else None.
+        """
+        completed = self.completed()
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers)
+        try:
+            futures = {
+                executor.submit(self._call, fn, job, args): job
+                for job, args in jobs if job not in completed
+            }
+            for future in concurrent.futures.as_completed(futures):
+                yield (futures[future], *future.result())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
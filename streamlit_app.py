@@ -1,30 +1,17 @@
 import datetime
 import os
 
-import dateparser
 import streamlit as st
 import pandas as pd
 import sqlalchemy
 from bokeh.models.widgets import Div
 from dotenv import load_dotenv
 
+from database import (DB, count_matches, daily_counts, date_bounds,
+                      search_articles)
 from style import Style
 
 
-class DB:
-    def __init__(self, conn_string):
-        self.conn_string = conn_string
-
-    def select(self, db_name):
-        args = {
-            'dbname': db_name,
-            # 'sslrootcert': 'certs/DigiCertGlobalRootCA.crt.pem',
-            # 'sslmode': 'verify-full'
-        }
-        db = sqlalchemy.create_engine(self.conn_string, connect_args=args)
-        return db
-
-
 @st.cache(persist=True)
 def convert_df(df):
     return df.to_csv().encode('utf-8')
@@ -40,16 +27,116 @@ def download_file_button(df):
     )
 
 
+TABLES = {'en': 'articles', 'es': 'articles_es'}
+PAGE_SIZE = 100
+
+
 @st.cache(allow_output_mutation=True)
 def load_db():
     load_dotenv()
     psql = DB(os.environ['POSTGRES_CON_STRING'])
-    db = psql.select('postgres').connect()
-    min_ = db.execute(
-        f'SELECT * FROM articles ORDER BY published ASC LIMIT 1;').fetchall()
-    max_ = db.execute(
-        f'SELECT * FROM articles ORDER BY published DESC LIMIT 1;').fetchall()
-    return db, min_, max_
+    return psql.select('postgres')
+
+
+def ingest_version(db):
+    """Returns a marker that changes every time the ingest job writes.
+
+    It is the number of articles and the last day of each table in the
+    daily counts summary, which `copy_merge` updates in the same
+    transaction as the articles. It is part of the cache key of the range
+    queries, so cached pages are invalidated as soon as new articles are
+    ingested.
+    """
+    with db.connect() as con:
+        if not sqlalchemy.inspect(con).has_table('article_daily_counts'):
+            return ''
+        return ','.join(
+            '/'.join(map(str, row)) for row in con.execute(
+                'SELECT table_name, sum(articles), max(day) FROM '
+                'article_daily_counts GROUP BY table_name '
+                'ORDER BY table_name;'))
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def load_bounds(table, version):
+    db = load_db()
+    with db.connect() as con:
+        min_, max_ = date_bounds(con, table)
+        if min_ is None:
+            min_, max_ = con.execute(
+                f'SELECT min(published), max(published) FROM {table};').one()
+            min_, max_ = (pd.to_datetime(min_).date(),
+                          pd.to_datetime(max_).date())
+    return min_, max_
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def count_rows(table, from_date, to_date, version):
+    db = load_db()
+    with db.connect() as con:
+        return con.execute(
+            sqlalchemy.text(
+                f'SELECT count(*) FROM {table} '
+                'WHERE published BETWEEN :from_date AND :to_date;'), {
+                    'from_date': str(from_date),
+                    'to_date': str(to_date)
+                }).scalar()
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def load_page(table, from_date, to_date, page, version):
+    db = load_db()
+    df = pd.read_sql(sqlalchemy.text(
+        'SELECT "index", title, link, published, keywords, summary '
+        f'FROM {table} WHERE published BETWEEN :from_date AND '
+        ':to_date ORDER BY published DESC, "index" LIMIT :limit '
+        'OFFSET :offset;'),
+                     db,
+                     params={
+                         'from_date': str(from_date),
+                         'to_date': str(to_date),
+                         'limit': PAGE_SIZE,
+                         'offset': (page - 1) * PAGE_SIZE
+                     })
+    df.rename(columns=dict([(x, x.capitalize()) for x in df.columns]),
+              inplace=True)
+    df.drop(columns=['Index'], inplace=True)
+    df.index += (page - 1) * PAGE_SIZE
+    return df
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def count_search(table, search, from_date, to_date, version):
+    db = load_db()
+    with db.connect() as con:
+        return count_matches(con, table, search, from_date, to_date)
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def search_page(table, search, from_date, to_date, page, version):
+    db = load_db()
+    with db.connect() as con:
+        df = search_articles(con,
+                             table,
+                             search,
+                             from_date,
+                             to_date,
+                             limit=PAGE_SIZE,
+                             offset=(page - 1) * PAGE_SIZE)
+    df.rename(columns=dict([(x, x.capitalize()) for x in df.columns]),
+              inplace=True)
+    df.drop(columns=['Index', 'Rank'], inplace=True)
+    df.index += (page - 1) * PAGE_SIZE
+    return df
+
+
+@st.cache(ttl=3600, show_spinner=False)
+def load_counts(table, from_date, to_date, version):
+    db = load_db()
+    with db.connect() as con:
+        if date_bounds(con, table)[0] is None:
+            return
+        return daily_counts(con, table, from_date, to_date)
 
 
 def page_config():
@@ -91,18 +178,20 @@ def main(min_, max_):
         from_date = st.sidebar.date_input('From',
                                           today_ - datetime.timedelta(days=30),
                                           key=0,
-                                          min_value=dateparser.parse(min_[0][2]),
-                                          max_value=dateparser.parse(max_[0][2]))
+                                          min_value=min_,
+                                          max_value=max_)
     with col2:
         to_date = st.sidebar.date_input('To',
-                                        dateparser.parse(max_[0][2]),
+                                        max_,
                                         key=1,
-                                        min_value=dateparser.parse(min_[0][2]),
-                                        max_value=dateparser.parse(max_[0][2]))
+                                        min_value=min_,
+                                        max_value=max_)
 
     language = st.sidebar.selectbox(
         'Language', ('English (US/Canada)', 'Spanish (México)'))
 
+    search = st.sidebar.text_input('Search (e.g., bite child park)').strip()
+
     language = 'en' if language == 'English (US/Canada)' else 'es'
     country = 'US' if language == 'en' else 'MX'
 
@@ -117,6 +206,7 @@ def main(min_, max_):
         'to_date': to_date,
         'language': language,
         'country': country,
+        'search': search
     }
     return kwargs
 
@@ -125,36 +215,44 @@ if __name__ == '__main__':
     #-------------------------------------------------------------------------
     page_config()
     #-------------------------------------------------------------------------
-    db, min_, max_ = load_db()
-    kwargs = main(min_, max_)
+    db = load_db()
+    version = ingest_version(db)
+    kwargs = main(*load_bounds('articles', version))
 
-    if kwargs.get('language') == 'en':
-        db_table = 'articles'
+    db_table = TABLES[kwargs.get('language')]
+    search = kwargs.get('search')
+    if search:
+        count = count_search(db_table, search, kwargs.get('from_date'),
+                             kwargs.get('to_date'), version)
     else:
-        db_table = 'articles_es'
-    df = pd.read_sql(
-        f"SELECT * FROM {db_table} WHERE published BETWEEN \'{kwargs.get('from_date')}\' AND \'{kwargs.get('to_date')}\';",
-        db)
-    df.rename(columns=dict([(x, x.capitalize()) for x in df.columns]),
-              inplace=True)
-    df.drop(columns=['Index'], inplace=True)
-    df.sort_values(by=['Published'], inplace=True, ascending=False)
-    df.reset_index(drop=True, inplace=True)
-
-    placeholder = st.empty()
-    placeholder_1 = st.empty()
-
-    if len(df) > 300:
-        placeholder.warning('Date range is too wide. Select a narrower range!')
-        if placeholder_1.button('Run anyway...'):
-            placeholder_1.empty()
-            placeholder.markdown(df.to_markdown())
+        counts = load_counts(db_table, kwargs.get('from_date'),
+                             kwargs.get('to_date'), version)
+        if counts is None:
+            count = count_rows(db_table, kwargs.get('from_date'),
+                               kwargs.get('to_date'), version)
+        else:
+            count = int(counts.articles.sum())
+            st.bar_chart(counts.articles)
+    st.markdown(f'**{count}** articles')
+    pages = max(1, -(-count // PAGE_SIZE))
+    page = int(
+        st.sidebar.number_input(f'Page (of {pages})',
+                                min_value=1,
+                                max_value=pages,
+                                value=1,
+                                step=1))
+    if search:
+        df = search_page(db_table, search, kwargs.get('from_date'),
+                         kwargs.get('to_date'), page, version)
     else:
-        st.markdown(df.to_markdown())
+        df = load_page(db_table, kwargs.get('from_date'),
+                       kwargs.get('to_date'), page, version)
+
+    st.markdown(df.to_markdown())
     #-------------------------------------------------------------------------
     st.sidebar.markdown('---')
     st.sidebar.subheader('Request')
-    kwargs.update({'query_results_count': len(df)})
+    kwargs.update({'query_results_count': count, 'page': page})
     st.sidebar.json(kwargs)
     #-------------------------------------------------------------------------
     st.sidebar.markdown('---')
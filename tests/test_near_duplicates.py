@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Near-duplicate clusters, when the representative of a cluster fails."""
+
+import concurrent.futures
+import time
+
+import google_news_api
+from near_duplicates import ClusterState, NearDuplicateIndex, minhash
+
+LINKS = [f'https://example.com/copy-{i}.html' for i in range(4)]
+# The extractor of newspaper keeps paragraphs with enough stopwords
+STORY = [
+    'A coyote bit a hiker on the trail behind the county park on Sunday '
+    'morning, and the officials of the wildlife service closed the trail '
+    'for the rest of the week while they look for the animal.',
+    'The hiker was taken to the hospital with a minor injury to the leg, '
+    'and was able to go home in the evening, according to a statement '
+    'from the police of the county.',
+    'Residents of the neighborhood said that they had seen the coyote near '
+    'their yards for several days, and that it did not seem to be afraid '
+    'of the people who were walking their dogs in the area.',
+    'The officials asked the residents to keep their pets inside at night, '
+    'to remove any food from their yards, and to report every sighting of '
+    'the animal to the wildlife service as soon as possible.'
+]
+
+
+def extracted(n: int) -> dict:
+    title = f'Coyote bites a hiker, copy {n}'
+    text = '\n\n'.join(STORY)
+    return {
+        'title': title,
+        'text': text,
+        'signature': minhash(f'{title} {text}')
+    }
+
+
+def summary(link: str) -> dict:
+    return {'text': '', 'keywords': ['coyote'], 'summary': f'From {link}'}
+
+
+def test_failed_representative_then_duplicate(tmp_path):
+    clusters = ClusterState(NearDuplicateIndex(f'{tmp_path}/index.sqlite3'))
+    assert clusters.match(LINKS[0], extracted(0)) == (None, True)
+    assert clusters.match(LINKS[1], extracted(1)) == (None, False)
+    assert clusters.match(LINKS[2], extracted(2)) == (None, False)
+
+    promoted = clusters.representative_failed(LINKS[0])
+    assert promoted[0] == LINKS[1]
+    # A near-duplicate of the failed representative waits for the new one
+    assert clusters.match(LINKS[3], extracted(3)) == (None, False)
+
+    done = clusters.representative_done(LINKS[1], summary(LINKS[1]))
+    assert [x for x, _ in done] == [LINKS[2], LINKS[3]]
+    assert {x['summary'] for _, x in done} == {f'From {LINKS[1]}'}
+    assert len({clusters.cluster(x) for x in LINKS}) == 1
+
+    # The failed representative has no content and nothing to wait for, so
+    # a copy of it is summarized
+    assert clusters.match('https://example.com/late.html',
+                          extracted(0)) == (None, True)
+
+
+def test_failed_representative_without_duplicates(tmp_path):
+    clusters = ClusterState(NearDuplicateIndex(f'{tmp_path}/index.sqlite3'))
+    assert clusters.match(LINKS[0], extracted(0)) == (None, True)
+    assert clusters.representative_failed(LINKS[0]) is None
+    # The next near-duplicate starts a new summary
+    assert clusters.match(LINKS[1], extracted(1)) == (None, True)
+
+
+class MemoryFetcher:
+    """Yields the pages one at a time, like a slow `AsyncFetcher`."""
+    # Seconds before each page is received. The parsed pages are collected
+    # when the next one is received, so the second copy waits for the first
+    # one, and the third and last copies are matched after it failed.
+    delays = [.2, .2, .2, 2.]
+
+    def fetch(self, urls: list):
+        for url in urls:
+            n = LINKS.index(url)
+            time.sleep(self.delays[n])
+            paragraphs = ''.join(f'<p>{x}</p>' for x in STORY)
+            yield url, (f'<html><head><title>Coyote bites a hiker, copy {n}'
+                        f'</title></head><body><article>{paragraphs}'
+                        '</article></body></html>')
+
+
+def summarize_batch(batch: list, language: str) -> list:
+    time.sleep(1)
+    return [(link, None if link == LINKS[0] else {
+        **summary(link), 'text': text
+    }, {}) for link, _, text in batch]
+
+
+def test_iter_articles_failed_representative(tmp_path):
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        search = google_news_api.Search(
+            'coyote',
+            1,
+            2020,
+            'en',
+            'US',
+            testing=False,
+            silent=True,
+            fetcher=MemoryFetcher(),
+            nlp_executor=executor,
+            summarizer=summarize_batch,
+            nlp_batch_size=1,
+            duplicates=NearDuplicateIndex(f'{tmp_path}/index.sqlite3'))
+        entries = [{
+            'id': link,
+            'title': f'Copy {n}',
+            'link': link,
+            'published': 'Mon, 06 Jan 2020 12:00:00 GMT',
+            'source': {
+                'href': 'https://example.com',
+                'title': 'Example'
+            }
+        } for n, link in enumerate(LINKS)]
+        articles = {
+            x['link']: x
+            for x in search.iter_articles({'entries': entries})
+        }
+    assert {x: articles[x]['summary'] for x in LINKS} == {
+        x: '' if x == LINKS[0] else f'From {LINKS[1]}'
+        for x in LINKS
+    }
+    assert len({articles[x]['cluster'] for x in LINKS}) == 1
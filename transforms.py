@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Column-wise cleaning and formatting of article dataframes.
+
+Batched equivalents of the per-value helpers of `ExportData`
+(`remove_bad_chars`, `md_link`, `source`, `style_keywords`) and of
+`daily._hash`. Each function runs one pass over a whole column instead of
+a `Series.apply` call per cell, and returns a new column with the same
+index.
+"""
+
+import hashlib
+
+import pandas as pd
+
+SOURCE_CHARS = str.maketrans(dict.fromkeys('()[]|', ' '))
+
+
+def _column(values: list, like: pd.Series) -> pd.Series:
+    return pd.Series(values, index=like.index, name=like.name, dtype=object)
+
+
+def clean_text(s: pd.Series) -> pd.Series:
+    """Removes the characters that might break a markdown table."""
+    return _column([
+        x.replace('|', ' ').replace('\n', ' ').replace('  ', ' ')
+        for x in s.tolist()
+    ], s)
+
+
+def md_links(s: pd.Series) -> pd.Series:
+    """Formats a column of links as generic markdown hyperlinks."""
+    return _column([f'[Link]({x})' for x in s.tolist()], s)
+
+
+def md_sources(s: pd.Series) -> pd.Series:
+    """Formats a column of feed `source` dictionaries as markdown links."""
+    return _column([
+        f'[{x["title"].translate(SOURCE_CHARS)}]({x["href"]})'
+        for x in s.tolist()
+    ], s)
+
+
+def style_keywords(s: pd.Series) -> pd.Series:
+    """Formats a column of keyword lists as sorted, comma-separated code."""
+    return _column([
+        ', '.join([f'`{keyword}`' for keyword in sorted(x)])
+        for x in s.tolist()
+    ], s)
+
+
+def hash_titles(s: pd.Series) -> pd.Series:
+    """Returns the md5 hex digest of each value of a column."""
+    md5 = hashlib.md5
+    return _column([md5(x.encode('utf-8')).hexdigest() for x in s.tolist()],
+                   s)
+
+
+def replace_escaped_newlines(df: pd.DataFrame) -> pd.DataFrame:
+    """Replaces literal "\\n" sequences with spaces, in place.
+
+    Only the text columns are scanned; the lists, dictionaries and dates of
+    the other columns are left as they are.
+    """
+    for column in df.columns:
+        if pd.api.types.infer_dtype(df[column], skipna=True) == 'string':
+            df[column] = _column([
+                x.replace('\\n', ' ') if isinstance(x, str) else x
+                for x in df[column].tolist()
+            ], df[column])
+    return df